@@ -1,7 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import UserProfile, EmailOTP
-from django.core.mail import send_mail
+from store.jobs import enqueue
+from .tasks import send_otp_email
 
 # ✅ Serialize base user info
 class UserSerializer(serializers.ModelSerializer):
@@ -59,14 +60,8 @@ class RegisterSerializer(serializers.ModelSerializer):
         otp_entry, _ = EmailOTP.objects.get_or_create(user=user)
         otp = otp_entry.generate_otp()
 
-        # ✅ Send OTP email
-        send_mail(
-            subject='Your OTP Code',
-            message=f'Your OTP is: {otp}',
-            from_email='youremail@gmail.com',  # 🔁 Replace with your real sender email
-            recipient_list=[email],
-            fail_silently=False,
-        )
+        # ✅ Send OTP email from the job queue, off the request path
+        enqueue(send_otp_email, user_id=user.pk)
 
         return user
 
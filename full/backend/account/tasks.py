@@ -0,0 +1,20 @@
+from django.core.mail import send_mail
+
+from store.jobs import task
+
+from .models import EmailOTP
+
+
+@task()
+def send_otp_email(user_id):
+    # Read the OTP when sending, so a retry after a regenerated code sends the current one.
+    otp_entry = EmailOTP.objects.select_related('user').filter(user_id=user_id).first()
+    if otp_entry is None:
+        return
+    send_mail(
+        subject='Your OTP Code',
+        message=f'Your OTP is: {otp_entry.otp}',
+        from_email='youremail@gmail.com',  # 🔁 Replace with your real sender email
+        recipient_list=[otp_entry.user.email],
+        fail_silently=False,
+    )
@@ -9,6 +9,8 @@ from django.contrib.auth.models import User
 from .models import UserProfile, EmailOTP
 from .Serializers import RegisterSerializer, UserProfileSerializer, OTPVerifySerializer
 from django.core.mail import send_mail
+from django.utils.decorators import method_decorator
+from store.idempotency import idempotent
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,6 +20,7 @@ logger = logging.getLogger(__name__)
 class RegisterView(APIView):
     permission_classes = [AllowAny]
 
+    @method_decorator(idempotent())
     def post(self, request):
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
@@ -0,0 +1,57 @@
+"""
+orjson-backed drop-ins for DRF's ``JSONRenderer`` and ``JSONParser``.
+
+The output is byte-for-byte what the stock renderer produces for the
+compact, UTF-8 responses the API sends: datetimes and Decimals go through
+DRF's own encoder rules, and U+2028/U+2029 are escaped the same way.
+Anything orjson can't produce identically (indented output for the
+browsable API, ASCII-only output, integers wider than 64 bits) falls back
+to the stock implementation, as does everything when orjson isn't
+installed. The only other differences are floats that need an exponent
+(``1e16`` rather than ``1e+16``, same value) and NaN, which orjson writes
+as ``null`` where strict DRF raises.
+"""
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+_default = JSONEncoder().default
+
+
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET).lower()
+        # orjson only reads UTF-8 and always rejects NaN/Infinity, like strict mode.
+        if orjson is None or not self.strict or encoding not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,28 @@
+"""
+Test runner for ``manage.py test``.
+
+Product saves keep the search index file in step (``store.signals``), so
+every test that creates a product writes to ``SEARCH_INDEX_PATH``. The
+runner points it at a throwaway file for the whole run, leaving the
+development index alone.
+"""
+import os
+import tempfile
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._index_dir = tempfile.TemporaryDirectory()
+        self._index_settings = override_settings(
+            SEARCH_INDEX_PATH=os.path.join(self._index_dir.name, 'search_index.sqlite3'),
+        )
+        self._index_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._index_settings.disable()
+        self._index_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
@@ -53,6 +53,15 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'backend.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'backend.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 
 SIMPLE_JWT = {
@@ -73,6 +82,46 @@ EMAIL_USE_TLS = config('EMAIL_USE_TLS', cast=bool)
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 
+# Catalog response cache. Local memory works per process; point CACHE_BACKEND at
+# a shared cache (e.g. django.core.cache.backends.redis.RedisCache) in production.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='bajaj-emporium'),
+    }
+}
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=300, cast=int)
+
+# List endpoints answer without ?cursor / ?page_size with a plain array of at most this many rows.
+UNPAGINATED_MAX_ROWS = config('UNPAGINATED_MAX_ROWS', default=500, cast=int)
+
+# SQLite FTS5 file backing /api/search/ (see store/search.py).
+SEARCH_INDEX_PATH = config('SEARCH_INDEX_PATH', default=os.path.join(BASE_DIR, 'search_index.sqlite3'))
+
+# Typeahead index for /api/search/suggest/ (see store/suggest.py): the best-selling products it holds
+# at most, and how often each process rebuilds it to pick up other processes' writes (seconds).
+SUGGEST_INDEX_MAX_PRODUCTS = config('SUGGEST_INDEX_MAX_PRODUCTS', default=200000, cast=int)
+SUGGEST_INDEX_TTL = config('SUGGEST_INDEX_TTL', default=300, cast=int)
+
+# Carts untouched for this many seconds give their held stock back (manage.py release_abandoned_carts).
+CART_RESERVATION_TTL = config('CART_RESERVATION_TTL', default=60 * 60 * 24, cast=int)
+
+# Sales rollups (manage.py rollup_sales) skip order events younger than this many seconds, so an event
+# committed late by a long transaction isn't passed over; keep it above the longest checkout transaction.
+ROLLUP_SETTLE_SECONDS = config('ROLLUP_SETTLE_SECONDS', default=60, cast=int)
+
+# Buffered sales/view/wishlist counters are written every this many seconds per worker (store/counters.py).
+COUNTER_FLUSH_INTERVAL = config('COUNTER_FLUSH_INTERVAL', default=10, cast=int)
+
+# Background jobs (store/jobs.py, manage.py run_jobs): running jobs locked longer than this are retried;
+# JOBS_RUN_INLINE runs them in-process after commit instead, for development without a worker.
+JOB_LOCK_TIMEOUT = config('JOB_LOCK_TIMEOUT', default=60 * 10, cast=int)
+JOBS_RUN_INLINE = config('JOBS_RUN_INLINE', default=False, cast=bool)
+
+# Responses replayed for retried Idempotency-Key requests are kept this long (manage.py purge_idempotency_keys).
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=60 * 60 * 24, cast=int)
+
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
@@ -110,6 +159,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+# Runs tests against a throwaway SEARCH_INDEX_PATH (see backend/runner.py).
+TEST_RUNNER = 'backend.runner.TestRunner'
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.mysql',
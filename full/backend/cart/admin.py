@@ -1,9 +1,41 @@
+from django.contrib import admin, messages
+from .models import CartItem, Cart, Order, OrderEvent, WishlistItem
+from .order_status import transition_orders
 
-from django.contrib import admin
-from .models import CartItem, Cart, Order, WishlistItem
+
+class OrderEventInline(admin.TabularInline):
+    model = OrderEvent
+    extra = 0
+    fields = ('created_at', 'from_status', 'to_status', 'actor', 'note')
+    readonly_fields = fields
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+def _transition_action(to_status):
+    def action(modeladmin, request, queryset):
+        moved, failed = transition_orders(queryset.values_list('pk', flat=True), to_status, actor=request.user)
+        if moved:
+            modeladmin.message_user(request, f"Moved {len(moved)} orders to {to_status}.", messages.SUCCESS)
+        for pk, reason in sorted(failed.items()):
+            modeladmin.message_user(request, f"Order #{pk}: {reason}", messages.WARNING)
+    action.__name__ = f'mark_{to_status}'
+    action.short_description = f"Mark selected orders as {to_status}"
+    return action
+
+
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'status', 'total_cost', 'created_at')
+    list_filter = ('status',)
+    # Status only moves through the actions, so every change is validated and logged.
+    readonly_fields = ('status', 'total_cost', 'created_at', 'updated_at')
+    inlines = [OrderEventInline]
+    actions = [_transition_action(status) for status in ('processing', 'shipped', 'delivered', 'cancelled', 'refunded')]
 
 
 admin.site.register(CartItem)
 admin.site.register(Cart)
-admin.site.register(Order)
+admin.site.register(Order, OrderAdmin)
 admin.site.register(WishlistItem)
@@ -0,0 +1,120 @@
+"""
+Turning a cart into an order.
+
+Stock was already taken when the items went into the cart, so checkout only
+moves lines: one transaction reads the cart's lines with their products,
+writes the order and its items (``bulk_create``, each with a JSON snapshot of
+the product as sold), and empties the cart with one ``DELETE``. The
+confirmation email is queued as a job in the same transaction.
+
+Clients send an ``Idempotency-Key`` header so a retried checkout returns the
+order the first attempt created instead of a second one. Besides the
+response replay in ``store.idempotency``, the key is stored on the order
+under a ``(user, key)`` unique constraint, so it holds after the replay
+expires; the cart row lock taken first makes a concurrent retry wait for
+the original and then find it.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from store.counters import incr
+from store.jobs import enqueue
+from store.models import ProductImage
+
+from .inventory import lock_cart
+from .models import Cart, CartItem, Order, OrderItem
+from .order_status import record_placed
+from .tasks import send_order_confirmation
+
+
+class EmptyCart(Exception):
+    pass
+
+
+def place_order(user, idempotency_key=None, shipping_address=None, payment_method=None):
+    """
+    Check out ``user``'s cart. Returns ``(order, created)``; ``created`` is
+    False when ``idempotency_key`` matches an order placed earlier.
+    Raises :class:`EmptyCart` when there is nothing to order.
+    """
+    with transaction.atomic():
+        cart = Cart.objects.filter(user=user).only('pk').first()
+        if cart:
+            lock_cart(cart.pk)
+        if idempotency_key:
+            order = Order.objects.filter(user=user, idempotency_key=idempotency_key).first()
+            if order:
+                return order, False
+        if not cart:
+            raise EmptyCart
+
+        lines = list(
+            CartItem.objects.filter(cart=cart).order_by('pk')
+            .select_related('product__brand', 'product__category')
+        )
+        if not lines:
+            raise EmptyCart
+
+        images = _first_images([line.product_id for line in lines])
+        items = []
+        total_cost = Decimal('0')
+        for line in lines:
+            product = line.product
+            price = product.discounted_price or product.price
+            total_cost += price * line.quantity
+            items.append(OrderItem(
+                product_name=product.name,
+                product_price=price,
+                quantity=line.quantity,
+                product_data=product_snapshot(product, images.get(product.pk)),
+            ))
+
+        order = Order.objects.create(
+            user=user,
+            total_cost=total_cost,
+            shipping_address=shipping_address,
+            payment_method=payment_method,
+            idempotency_key=idempotency_key or None,
+        )
+        for item in items:
+            item.order = order
+        OrderItem.objects.bulk_create(items)
+        record_placed(order, actor=user)
+        enqueue(send_order_confirmation, order_id=order.pk)
+
+        CartItem.objects.filter(cart=cart).delete()
+        Cart.objects.filter(pk=cart.pk).update(item_count=0, subtotal=0)
+        transaction.on_commit(lambda: _count_sales(lines))
+    return order, True
+
+
+def product_snapshot(product, image=None):
+    """What an order line remembers about its product; ``id`` feeds ``store.recommendations``."""
+    return {
+        'id': product.pk,
+        'name': product.name,
+        'slug': product.slug,
+        'brand_id': product.brand_id,
+        'brand': product.brand.name if product.brand_id else None,
+        'category_id': product.category_id,
+        'category': product.category.name if product.category_id else None,
+        'price': str(product.price),
+        'discount_percentage': product.discount_percentage,
+        'discounted_price': str(product.discounted_price) if product.discounted_price else None,
+        'image': image,
+    }
+
+
+def _count_sales(lines):
+    for line in lines:
+        incr('sales_count', line.product_id, line.quantity)
+
+
+def _first_images(product_ids):
+    images = {}
+    rows = ProductImage.objects.filter(product_id__in=product_ids).order_by('pk').values_list('product_id', 'image')
+    for product_id, name in rows:
+        if name and product_id not in images:
+            images[product_id] = ProductImage._meta.get_field('image').storage.url(name)
+    return images
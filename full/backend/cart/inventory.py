@@ -0,0 +1,125 @@
+"""
+Stock held by carts.
+
+Stock is taken when an item goes into a cart and given back when it leaves.
+Both are single conditional ``UPDATE`` statements on the product row, so
+concurrent shoppers never wait on each other's transactions beyond the
+statement itself, and stock can't go negative: the ``stock >= quantity``
+check and the decrement happen atomically in the database. Run them last
+in a transaction so the row lock is held only until the commit.
+
+Carts idle for ``CART_RESERVATION_TTL`` seconds give their stock back via
+:func:`release_abandoned_carts`. Every cart mutation starts with
+:func:`lock_cart`, so the sweeper (which skips locked carts) and live
+traffic never work on the same cart at once.
+
+Stock is part of every cached product list, so each stock change moves the
+Product stamp and the catalog version together: list validators and cached
+bodies go stale at the same moment, never one without the other.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, Sum, Value, When
+from django.utils.timezone import now
+
+from store.cache import bump_catalog_version, touch_model
+from store.models import Product
+
+from .models import Cart, CartItem
+
+STOCK_CHUNK_SIZE = 500
+
+
+def lock_cart(cart_id):
+    """Mark the cart active and hold its row lock until the end of the transaction."""
+    Cart.objects.filter(pk=cart_id).update(updated_at=now())
+
+
+class InsufficientStock(Exception):
+    pass
+
+
+def reserve(product_id, quantity):
+    """Take ``quantity`` from the product's stock. Returns False if there isn't enough."""
+    reserved = Product.objects.filter(pk=product_id, stock__gte=quantity).update(
+        stock=F('stock') - quantity, updated_at=now(),
+    )
+    if reserved:
+        _stock_changed()
+    return bool(reserved)
+
+
+def release(product_id, quantity):
+    """Give ``quantity`` back to the product's stock."""
+    if quantity <= 0:
+        return
+    Product.objects.filter(pk=product_id).update(stock=F('stock') + quantity, updated_at=now())
+    _stock_changed()
+
+
+def adjust_stock(changes):
+    """
+    Apply ``{product_id: stock change}`` (negative takes stock) with one
+    conditional ``UPDATE ... CASE`` per ``STOCK_CHUNK_SIZE`` products, in
+    primary key order so concurrent callers lock rows alike.
+
+    Returns False if a product is missing or short of stock; earlier rows
+    may already be updated, so the caller must roll the transaction back.
+    """
+    product_ids = sorted(pk for pk, change in changes.items() if change)
+    for start in range(0, len(product_ids), STOCK_CHUNK_SIZE):
+        chunk = product_ids[start:start + STOCK_CHUNK_SIZE]
+        condition = Q()
+        for pk in chunk:
+            condition |= Q(pk=pk, stock__gte=-changes[pk]) if changes[pk] < 0 else Q(pk=pk)
+        updated = Product.objects.filter(condition).update(
+            stock=F('stock') + Case(*[When(pk=pk, then=Value(changes[pk])) for pk in chunk]),
+            updated_at=now(),
+        )
+        if updated != len(chunk):
+            return False
+    if product_ids:
+        _stock_changed()
+    return True
+
+
+def _stock_changed():
+    touch_model(Product)
+    bump_catalog_version()
+
+
+def release_items(items):
+    """Give back the stock held by the ``CartItem`` queryset ``items``; returns ``{product_id: quantity}``."""
+    held = dict(items.order_by().values_list('product_id').annotate(quantity=Sum('quantity')))
+    adjust_stock(held)
+    return held
+
+
+def release_abandoned_carts(ttl, batch_size=500):
+    """
+    Empty carts idle for more than ``ttl`` seconds, ``batch_size`` carts per
+    transaction, returning their stock. Returns ``(carts, units released)``.
+    """
+    cutoff = now() - timedelta(seconds=ttl)
+    carts = units = 0
+    while True:
+        with transaction.atomic():
+            cart_ids = list(
+                Cart.objects.select_for_update(skip_locked=True)
+                .filter(updated_at__lt=cutoff)
+                .filter(Exists(CartItem.objects.filter(cart=OuterRef('pk'))))
+                .order_by('updated_at')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not cart_ids:
+                break
+            items = CartItem.objects.filter(cart_id__in=cart_ids)
+            held = release_items(items)
+            items.delete()
+            Cart.objects.filter(pk__in=cart_ids).update(item_count=0, subtotal=0)
+        carts += len(cart_ids)
+        units += sum(held.values())
+        if len(cart_ids) < batch_size:
+            break
+    return carts, units
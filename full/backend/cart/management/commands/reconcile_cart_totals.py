@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from cart.totals import reconcile_totals
+
+
+class Command(BaseCommand):
+    help = "Report carts whose stored item_count/subtotal no longer match their lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Recompute the drifted carts")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        drifted = reconcile_totals(batch_size=options['batch_size'], fix=options['fix'])
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("All cart totals match"))
+            return
+        verb = "Fixed" if options['fix'] else "Found"
+        self.stdout.write(self.style.WARNING(f"{verb} {len(drifted)} drifted carts: {drifted[:20]}"))
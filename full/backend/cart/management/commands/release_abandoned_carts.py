@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cart.inventory import release_abandoned_carts
+
+
+class Command(BaseCommand):
+    help = "Empty carts idle past the reservation TTL and return their stock; safe to run alongside live traffic"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, default=None,
+                            help="Idle seconds before a cart is released (default: CART_RESERVATION_TTL)")
+        parser.add_argument('--batch-size', type=int, default=500, help="Carts per transaction")
+
+    def handle(self, *args, **options):
+        ttl = options['ttl'] if options['ttl'] is not None else settings.CART_RESERVATION_TTL
+        carts, units = release_abandoned_carts(ttl, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Released {units} units from {carts} abandoned carts"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from cart.rollups import rollup_sales
+
+
+class Command(BaseCommand):
+    help = "Fold order events since the last run into the daily sales rollups"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        count = rollup_sales(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {count} order events"))
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:58
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce, NullIf
+
+
+def backfill_cart_totals(apps, schema_editor):
+    Cart = apps.get_model('cart', 'Cart')
+    CartItem = apps.get_model('cart', 'CartItem')
+    price = Coalesce(NullIf(F('product__discounted_price'), Value(0)), F('product__price'))
+    rows = (
+        CartItem.objects.values('cart_id')
+        .annotate(
+            count=Sum('quantity'),
+            total=Sum(F('quantity') * price, output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+        )
+        .order_by()
+    )
+    for row in rows:
+        Cart.objects.filter(pk=row['cart_id']).update(item_count=row['count'], subtotal=row['total'] or Decimal('0'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0003_cart_updated_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_cart_totals, migrations.RunPython.noop),
+    ]
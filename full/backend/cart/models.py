@@ -12,13 +12,22 @@ class Cart(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Kept current by every cart mutation (cart.totals.update_totals).
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            # Finds idle carts for the abandoned-cart sweeper.
+            models.Index(fields=['updated_at'], name='cart_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Cart of {self.user.email}"
 
     @property
     def total_cost(self):
-        return sum(item.total_price for item in self.items.select_related('product'))
+        return self.subtotal
 
 class CartItem(models.Model):
     cart = models.ForeignKey(
@@ -78,6 +87,8 @@ class Order(models.Model):
     shipping_address = models.TextField(null=True, blank=True)
     payment_method = models.CharField(max_length=50, null=True, blank=True)
     transaction_id = models.CharField(max_length=100, null=True, blank=True)
+    # Client-supplied Idempotency-Key of the checkout that created the order.
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True, editable=False)
 
     def __str__(self):
         return f"Order #{self.id} - {self.user.email}"
@@ -87,6 +98,11 @@ class Order(models.Model):
         indexes = [
             models.Index(fields=['status']),
             models.Index(fields=['created_at']),
+            # Order history: a user's orders newest first, read backwards with the keyset cursor.
+            models.Index(fields=['user', 'created_at', 'id'], name='order_user_newest_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'idempotency_key'], name='order_idempotency_key_uniq'),
         ]
 
 class OrderItem(models.Model):
@@ -107,6 +123,84 @@ class OrderItem(models.Model):
     def total_price(self):
         return self.product_price * self.quantity
 
+class OrderEvent(models.Model):
+    """One status change of an order. Rows are only ever added (see cart.order_status)."""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='events')
+    # Null for the event that records the order being placed.
+    from_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES, null=True, blank=True)
+    to_status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'created_at', 'id'], name='order_event_history_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Order events are append-only")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Order #{self.order_id}: {self.from_status or '-'} -> {self.to_status}"
+
+class DailySales(models.Model):
+    """Units and revenue for one key on one day, summed from order events by cart.rollups."""
+    day = models.DateField()
+    name = models.CharField(max_length=255)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        abstract = True
+
+
+class ProductDailySales(DailySales):
+    # Plain ids: the rollup outlives the catalog rows it was built from.
+    product_id = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product_id'], name='product_daily_sales_uniq'),
+        ]
+
+
+class BrandDailySales(DailySales):
+    brand_id = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'brand_id'], name='brand_daily_sales_uniq'),
+        ]
+
+
+class CategoryDailySales(DailySales):
+    # 0 for products without a category.
+    category_id = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category_id'], name='category_daily_sales_uniq'),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """How far a rollup has read its source table."""
+    name = models.CharField(max_length=50, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
 class WishlistItem(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -0,0 +1,89 @@
+"""
+Order status changes.
+
+``TRANSITIONS`` lists the statuses each status may move to; anything else
+is refused. Every change is recorded as an ``OrderEvent``, which is never
+updated or deleted, so an order's events are its full status history.
+
+:func:`transition_orders` moves many orders at once: it locks them by
+primary key, checks each one against ``TRANSITIONS``, then applies one
+``UPDATE`` per source status, guarded by the status it read, and one
+``bulk_create`` of events, whatever the batch size. Orders the guard
+skipped, because they changed after they were read, get no event and are
+reported as failed, so every event's ``from_status`` is the status the
+row really left.
+"""
+from django.db import transaction
+from django.utils.timezone import now
+
+from .models import Order, OrderEvent
+
+TRANSITIONS = {
+    'pending': ('processing', 'cancelled'),
+    'processing': ('shipped', 'cancelled'),
+    'shipped': ('delivered',),
+    'delivered': ('refunded',),
+    'cancelled': (),
+    'refunded': (),
+}
+STATUSES = tuple(TRANSITIONS)
+TRANSITION_MAX_ORDERS = 1000
+
+
+def sources(to_status):
+    """The statuses an order may be moved to ``to_status`` from."""
+    return tuple(status for status, targets in TRANSITIONS.items() if to_status in targets)
+
+
+def transition_orders(order_ids, to_status, actor=None, note=''):
+    """
+    Move the orders in ``order_ids`` to ``to_status``.
+
+    Returns ``(moved, failed)``: the ids that moved, and ``{id: reason}`` for
+    those that didn't (unknown, or not allowed from their current status).
+    """
+    if to_status not in TRANSITIONS:
+        raise ValueError(f"Unknown status {to_status!r}")
+    allowed = sources(to_status)
+    order_ids = sorted(set(order_ids))
+    failed = {}
+    with transaction.atomic():
+        current = dict(
+            Order.objects.select_for_update().filter(pk__in=order_ids).order_by('pk').values_list('pk', 'status')
+        )
+        moved = []
+        for pk in order_ids:
+            if pk not in current:
+                failed[pk] = "Order not found"
+            elif current[pk] not in allowed:
+                failed[pk] = f"Cannot move from {current[pk]} to {to_status}"
+            else:
+                moved.append(pk)
+        if moved:
+            stamp = now()
+            by_status = {}
+            for pk in moved:
+                by_status.setdefault(current[pk], []).append(pk)
+            ours = set()
+            for status, group in by_status.items():
+                applied = Order.objects.filter(pk__in=group, status=status).update(status=to_status, updated_at=stamp)
+                if applied == len(group):
+                    ours.update(group)
+                else:
+                    # Another transaction got to some first (where select_for_update doesn't lock rows).
+                    ours.update(
+                        Order.objects.filter(pk__in=group, status=to_status, updated_at=stamp)
+                        .values_list('pk', flat=True)
+                    )
+            failed.update({pk: "Order was changed concurrently" for pk in moved if pk not in ours})
+            moved = [pk for pk in moved if pk in ours]
+            OrderEvent.objects.bulk_create([
+                OrderEvent(order_id=pk, from_status=current[pk], to_status=to_status, actor=actor, note=note)
+                for pk in moved
+            ])
+    return moved, failed
+
+
+def record_placed(order, actor=None):
+    """The first event of a new order."""
+    return OrderEvent.objects.create(order=order, from_status=None, to_status=order.status, actor=actor)
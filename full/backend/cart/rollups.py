@@ -0,0 +1,145 @@
+"""
+Daily sales per product, brand and category.
+
+The source is ``OrderEvent``, which only grows: the event that places an
+order adds its lines to the day the order was placed, and a later move to
+cancelled or refunded takes them off again. :func:`rollup_sales` reads the
+events past its watermark (an event id) in batches and advances the
+watermark in the same transaction as the rollup rows, so a run can be
+stopped and restarted at any point without counting an event twice.
+Reports read the rollup tables only.
+
+Event ids are handed out at insert but become visible at commit, so a
+checkout's event can commit after a higher id from a shorter transaction.
+The watermark therefore only moves over events older than
+``ROLLUP_SETTLE_SECONDS``, which must exceed the longest transaction that
+writes events; everything newer waits for the next run.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import localtime, now
+
+from store.models import Product
+
+from .models import (
+    BrandDailySales, CategoryDailySales, OrderEvent, OrderItem, ProductDailySales, RollupWatermark,
+)
+
+VOID_STATUSES = ('cancelled', 'refunded')
+WATERMARK = 'sales'
+ROLLUPS = {
+    'product': (ProductDailySales, 'product_id'),
+    'brand': (BrandDailySales, 'brand_id'),
+    'category': (CategoryDailySales, 'category_id'),
+}
+
+
+def event_sign(from_status, to_status):
+    """+1 when the event places the order, -1 when it voids it, else 0."""
+    return (from_status is None) - (to_status in VOID_STATUSES)
+
+
+def rollup_sales(batch_size=5000):
+    """Fold new order events into the daily rollups. Returns the number of events read."""
+    processed = 0
+    settled_before = now() - timedelta(seconds=getattr(settings, 'ROLLUP_SETTLE_SECONDS', 60))
+    while True:
+        with transaction.atomic():
+            RollupWatermark.objects.get_or_create(name=WATERMARK)
+            watermark = RollupWatermark.objects.select_for_update().get(name=WATERMARK)
+            events = list(
+                OrderEvent.objects.filter(pk__gt=watermark.position).order_by('pk')
+                .values_list('pk', 'order_id', 'from_status', 'to_status', 'order__created_at', 'created_at')
+                [:batch_size]
+            )
+            read = len(events)
+            # Stop at the first unsettled event: a lower id may still be uncommitted behind it.
+            for index, event in enumerate(events):
+                if event[-1] >= settled_before:
+                    events = events[:index]
+                    break
+            if not events:
+                break
+
+            signs = defaultdict(int)
+            days = {}
+            for _, order_id, from_status, to_status, created_at, _ in events:
+                sign = event_sign(from_status, to_status)
+                if sign:
+                    signs[order_id] += sign
+                    days[order_id] = localtime(created_at).date()
+            _apply(_totals({pk: sign for pk, sign in signs.items() if sign}, days))
+
+            watermark.position = events[-1][0]
+            watermark.save(update_fields=['position', 'updated_at'])
+        processed += len(events)
+        if read < batch_size or len(events) < read:
+            break
+    return processed
+
+
+def _totals(signs, days):
+    lines = list(
+        OrderItem.objects.filter(order_id__in=signs)
+        .values_list('order_id', 'quantity', 'product_price', 'product_name', 'product_data')
+    )
+    # Snapshots from before brand and category ids were recorded fall back to the product as it is now.
+    missing = {
+        data.get('id') for *_, data in lines
+        if data.get('id') and ('brand_id' not in data or 'category_id' not in data)
+    }
+    current = {
+        row['pk']: row for row in
+        Product.objects.filter(pk__in=missing).values('pk', 'brand_id', 'brand__name', 'category_id', 'category__name')
+    }
+
+    totals = {kind: defaultdict(lambda: ['', 0, Decimal('0')]) for kind in ROLLUPS}
+    for order_id, quantity, price, product_name, data in lines:
+        product_id = data.get('id') or 0
+        fallback = current.get(product_id, {})
+        keys = {
+            'product': (product_id, product_name),
+            'brand': (
+                data.get('brand_id', fallback.get('brand_id')) or 0,
+                data.get('brand') or fallback.get('brand__name') or '',
+            ),
+            'category': (
+                data.get('category_id', fallback.get('category_id')) or 0,
+                data.get('category') or fallback.get('category__name') or '',
+            ),
+        }
+        units = signs[order_id] * quantity
+        for kind, (key, name) in keys.items():
+            total = totals[kind][days[order_id], key]
+            total[0] = name
+            total[1] += units
+            total[2] += units * price
+    return totals
+
+
+def _apply(totals):
+    for kind, rows in totals.items():
+        if not rows:
+            continue
+        model, field = ROLLUPS[kind]
+        existing = {
+            (row.day, getattr(row, field)): row for row in
+            model.objects.filter(day__in={day for day, _ in rows}, **{f'{field}__in': {key for _, key in rows}})
+        }
+        new, changed = [], []
+        for (day, key), (name, units, revenue) in rows.items():
+            row = existing.get((day, key))
+            if row is None:
+                new.append(model(day=day, name=name, units=units, revenue=revenue, **{field: key}))
+            else:
+                row.name = name or row.name
+                row.units += units
+                row.revenue += revenue
+                changed.append(row)
+        model.objects.bulk_create(new, batch_size=1000)
+        model.objects.bulk_update(changed, ['name', 'units', 'revenue'], batch_size=1000)
@@ -34,30 +34,39 @@ class CartSerializer(serializers.ModelSerializer):
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer()
+    # The product as it was sold; the catalog row may have changed or gone since.
+    product = serializers.JSONField(source='product_data', read_only=True)
     total_price = serializers.SerializerMethodField()
 
     class Meta:
         model = OrderItem
-        fields = ['id', 'product', 'quantity', 'total_price']
+        fields = ['id', 'product', 'product_name', 'product_price', 'quantity', 'total_price']
+        requires = {'total_price': ['product_price', 'quantity']}
 
     def get_total_price(self, obj):
-        price = obj.product.discounted_price or obj.product.price
-        return price * obj.quantity
+        return obj.total_price
+
+
+class OrderListSerializer(serializers.ModelSerializer):
+    """One row of the order history; ``item_count`` is annotated by the view."""
+    total_amount = serializers.DecimalField(source='total_cost', max_digits=12, decimal_places=2, read_only=True)
+    item_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'created_at', 'status', 'total_amount', 'item_count']
+
 
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
-    total_amount = serializers.SerializerMethodField()
+    total_amount = serializers.DecimalField(source='total_cost', max_digits=12, decimal_places=2, read_only=True)
 
     class Meta:
         model = Order
-        fields = ['id', 'created_at', 'items', 'total_amount']
-
-    def get_total_amount(self, obj):
-        return sum([
-            (item.product.discounted_price or item.product.price) * item.quantity
-            for item in obj.items.all()
-        ])
+        fields = [
+            'id', 'created_at', 'updated_at', 'status', 'items', 'total_amount',
+            'shipping_address', 'payment_method',
+        ]
 
 
 class WishlistItemSerializer(serializers.ModelSerializer):
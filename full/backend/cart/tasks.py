@@ -0,0 +1,23 @@
+from django.core.mail import send_mail
+
+from store.jobs import task
+
+from .models import Order
+
+
+@task()
+def send_order_confirmation(order_id):
+    order = Order.objects.select_related('user').filter(pk=order_id).first()
+    if order is None or not order.user.email:
+        return
+    lines = "\n".join(
+        f"{item.quantity} x {item.product_name} @ {item.product_price}"
+        for item in order.items.order_by('pk')
+    )
+    send_mail(
+        subject=f'Your order #{order.pk}',
+        message=f'Thank you for your order.\n\n{lines}\n\nTotal: {order.total_cost}',
+        from_email='youremail@gmail.com',
+        recipient_list=[order.user.email],
+        fail_silently=False,
+    )
@@ -1,3 +1,497 @@
-from django.test import TestCase
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase
+from django.utils.timezone import now
+from rest_framework.test import APIClient
+
+from store.cache import get_cache
+from store.models import Brand, IdempotencyKey, Product
+
+from .checkout import place_order
+from .inventory import release, release_abandoned_carts, reserve
+from .models import Cart, CartItem, Order, OrderEvent, OrderItem, ProductDailySales, RollupWatermark
+from .order_status import transition_orders
+from .rollups import rollup_sales
+from .totals import reconcile_totals
+
+
+class StockReservationTests(TransactionTestCase):
+    def setUp(self):
+        brand = Brand.objects.create(name="Brand")
+        self.product = Product.objects.create(name="Suit", description="-", price=1000, stock=50, brand=brand)
+
+    def client_for(self, username):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(username=username))
+        return client
+
+    def test_parallel_adds_never_oversell(self):
+        if connection.vendor == 'sqlite':
+            if connection.is_in_memory_db():
+                # Shared-cache locks fail at once instead of waiting, which whole requests can't retry;
+                # test_parallel_reserves_never_oversell covers reserve() on this database.
+                self.skipTest("an in-memory SQLite database can't queue concurrent transactions")
+            # Deferred transactions fail with "database is locked" when two upgrade to writers.
+            if connection.settings_dict['OPTIONS'].get('transaction_mode') != 'IMMEDIATE':
+                self.skipTest("SQLite needs OPTIONS transaction_mode IMMEDIATE (and a raised timeout) to serialize writers")
+        clients = [self.client_for(f"shopper{i}") for i in range(200)]
+
+        def add(client):
+            try:
+                response = client.post('/api/cart/add_to_cart/', {'product_id': self.product.pk, 'quantity': 1})
+                return response.status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            statuses = list(pool.map(add, clients))
+
+        self.product.refresh_from_db()
+        self.assertEqual(statuses.count(201), 50)
+        self.assertEqual(statuses.count(400), 150)
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(sum(CartItem.objects.values_list('quantity', flat=True)), 50)
+
+    def test_parallel_reserves_never_oversell(self):
+        # Runs on every backend: the in-memory SQLite test database is shared
+        # between threads, whose statements then wait on each other's locks.
+        barrier = threading.Barrier(16)
+
+        def take(_):
+            try:
+                barrier.wait()
+                for _ in range(100):
+                    try:
+                        return reserve(self.product.pk, 1)
+                    except OperationalError as e:
+                        if 'locked' not in str(e):
+                            raise
+                        time.sleep(0.001)
+                raise AssertionError("reserve() stayed locked out")
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(take, range(80)))
+
+        self.product.refresh_from_db()
+        self.assertEqual(results.count(True), 50)
+        self.assertEqual(self.product.stock, 0)
+
+    def test_update_quantity_moves_only_the_difference(self):
+        client = self.client_for("shopper")
+        client.post('/api/cart/add_to_cart/', {'product_id': self.product.pk, 'quantity': 5})
+        client.post('/api/cart/update_quantity/', {'product_id': self.product.pk, 'quantity': 2})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 48)
+
+        response = client.post('/api/cart/update_quantity/', {'product_id': self.product.pk, 'quantity': 51})
+        self.assertEqual(response.status_code, 400)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 48)
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+
+
+    def test_cached_lists_follow_reservations(self):
+        get_cache().clear()
+        Product.objects.filter(pk=self.product.pk).update(is_featured=True)
+        client = APIClient()
+        first = client.get('/api/products/featured/')
+        self.assertEqual(first.json()[0]['stock'], 50)
+
+        self.assertTrue(reserve(self.product.pk, 3))
+        second = client.get('/api/products/featured/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()[0]['stock'], 47)
+
+        release(self.product.pk, 3)
+        self.assertEqual(client.get('/api/products/featured/').json()[0]['stock'], 50)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="shopper")
+        brand = Brand.objects.create(name="Brand")
+        self.product = Product.objects.create(name="Suit", description="-", price=1000, stock=50, brand=brand)
+
+    def order(self, quantity):
+        order = Order.objects.create(user=self.user, total_cost=100 * quantity)
+        OrderItem.objects.create(
+            order=order, product_name="Suit", product_price=100, quantity=quantity,
+            product_data={'id': self.product.pk, 'brand_id': None, 'category_id': None},
+        )
+        return order
+
+    def event(self, pk, order, age):
+        OrderEvent.objects.create(pk=pk, order=order, to_status='pending')
+        OrderEvent.objects.filter(pk=pk).update(created_at=now() - timedelta(seconds=age))
+
+    def test_events_committed_out_of_id_order_are_not_lost(self):
+        first, late, quick = self.order(1), self.order(2), self.order(4)
+        # Event 2 belongs to a slow checkout that commits after event 3.
+        self.event(1, first, age=300)
+        self.event(3, quick, age=10)
+        self.assertEqual(rollup_sales(), 1)
+        self.assertEqual(RollupWatermark.objects.get().position, 1)
+
+        self.event(2, late, age=20)
+        with mock.patch('cart.rollups.now', return_value=now() + timedelta(minutes=2)):
+            self.assertEqual(rollup_sales(), 2)
+        self.assertEqual(RollupWatermark.objects.get().position, 3)
+        self.assertEqual(ProductDailySales.objects.get().units, 7)
+
+    def test_voided_orders_are_taken_off(self):
+        order = self.order(3)
+        self.event(1, order, age=300)
+        self.assertEqual(rollup_sales(), 1)
+        self.assertEqual(ProductDailySales.objects.get().units, 3)
+
+        OrderEvent.objects.create(order=order, from_status='pending', to_status='cancelled')
+        OrderEvent.objects.update(created_at=now() - timedelta(minutes=5))
+        self.assertEqual(rollup_sales(), 1)
+        self.assertEqual(ProductDailySales.objects.get().units, 0)
+        self.assertEqual(rollup_sales(), 0)
+
+
+class CartBatchTests(TestCase):
+    def setUp(self):
+        brand = Brand.objects.create(name="Brand")
+        self.suit = Product.objects.create(name="Suit", description="-", price=1000, stock=10, brand=brand)
+        self.shawl = Product.objects.create(name="Shawl", description="-", price=500, stock=3, brand=brand)
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(username="shopper"))
+
+    def batch(self, *operations):
+        return self.client.post('/api/cart/batch/', {'operations': list(operations)}, format='json')
+
+    def stock(self):
+        return list(Product.objects.order_by('pk').values_list('stock', flat=True))
+
+    def test_add_set_and_remove(self):
+        response = self.batch(
+            {'op': 'add', 'product_id': self.suit.pk, 'quantity': 2},
+            {'op': 'add', 'product_id': self.shawl.pk, 'quantity': 3},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['item_count'], 5)
+        self.assertEqual(self.stock(), [8, 0])
+
+        response = self.batch(
+            {'op': 'set', 'product_id': self.suit.pk, 'quantity': 5},
+            {'op': 'remove', 'product_id': self.shawl.pk, 'quantity': 1},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json()['changes'],
+            [{'product_id': self.suit.pk, 'quantity': 5, 'change': 3},
+             {'product_id': self.shawl.pk, 'quantity': 2, 'change': -1}],
+        )
+        self.assertEqual(self.stock(), [5, 1])
+
+        response = self.batch({'op': 'remove', 'product_id': self.shawl.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock(), [5, 3])
+        self.assertEqual(list(CartItem.objects.values_list('product_id', 'quantity')), [(self.suit.pk, 5)])
+
+    def test_unknown_product_is_not_found(self):
+        response = self.batch(
+            {'op': 'add', 'product_id': self.suit.pk, 'quantity': 1},
+            {'op': 'add', 'product_id': 999999, 'quantity': 1},
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['products'], [999999])
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(self.stock(), [10, 3])
+
+    def test_short_stock_changes_nothing(self):
+        response = self.batch(
+            {'op': 'add', 'product_id': self.suit.pk, 'quantity': 1},
+            {'op': 'add', 'product_id': self.shawl.pk, 'quantity': 4},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['products'], [self.shawl.pk])
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(self.stock(), [10, 3])
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        brand = Brand.objects.create(name="Brand")
+        self.suit = Product.objects.create(
+            name="Suit", slug="suit", description="-", price=1000, discount_percentage=20, stock=5, brand=brand,
+        )
+        self.shawl = Product.objects.create(name="Shawl", slug="shawl", description="-", price=500, stock=2, brand=brand)
+        self.user = get_user_model().objects.create_user(username="shopper")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add(self, product, quantity):
+        return self.client.post('/api/cart/add_to_cart/', {'product_id': product.pk, 'quantity': quantity})
+
+    def checkout(self, key=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post('/api/cart/orders/place_order/', {'payment_method': 'cod'}, **headers)
+
+    def test_checkout_snapshots_lines_and_empties_the_cart(self):
+        self.add(self.suit, 2)
+        self.add(self.shawl, 1)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 201)
+
+        order = Order.objects.get()
+        self.assertEqual(response.json()['order_id'], order.pk)
+        self.assertEqual(order.total_cost, 2100)
+        lines = {item.product_name: item for item in order.items.all()}
+        self.assertEqual((lines['Suit'].quantity, lines['Suit'].product_price), (2, 800))
+        self.assertEqual(lines['Suit'].product_data['id'], self.suit.pk)
+        self.assertEqual(lines['Suit'].product_data['brand'], "Brand")
+        self.assertEqual(list(order.events.values_list('from_status', 'to_status')), [(None, 'pending')])
+
+        self.assertFalse(CartItem.objects.exists())
+        self.assertEqual(Cart.objects.values_list('item_count', 'subtotal').get(), (0, 0))
+        self.assertEqual(list(Product.objects.order_by('pk').values_list('stock', flat=True)), [3, 1])
+
+    def test_retry_with_the_same_key_returns_the_same_order(self):
+        self.add(self.suit, 1)
+        first = self.checkout(key="checkout-1")
+        self.add(self.suit, 1)
+        retry = self.checkout(key="checkout-1")
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json()['order_id'], first.json()['order_id'])
+
+        # After the stored response is gone the order's own key still holds.
+        IdempotencyKey.objects.all().delete()
+        order, created = place_order(self.user, idempotency_key="checkout-1")
+        self.assertFalse(created)
+        self.assertEqual(order.pk, first.json()['order_id'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+        self.assertEqual(Product.objects.get(pk=self.suit.pk).stock, 3)
+
+    def test_empty_cart_is_rejected(self):
+        self.assertEqual(self.checkout().status_code, 400)
+        self.add(self.suit, 1)
+        self.client.post('/api/cart/clear_cart/')
+        self.assertEqual(self.checkout().status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_short_stock_is_rejected_before_checkout(self):
+        self.assertEqual(self.add(self.shawl, 3).status_code, 400)
+        self.assertEqual(self.add(self.shawl, 2).status_code, 201)
+        self.assertEqual(self.add(self.shawl, 1).status_code, 400)
+        self.assertEqual(self.checkout().status_code, 201)
+        self.assertEqual(OrderItem.objects.get().quantity, 2)
+        self.assertEqual(Product.objects.get(pk=self.shawl.pk).stock, 0)
+
+
+class OrderTransitionTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="shopper")
+        self.admin = get_user_model().objects.create_user(username="admin", is_staff=True)
+        self.pending = Order.objects.create(user=self.user, total_cost=100)
+        self.delivered = Order.objects.create(user=self.user, total_cost=100, status='delivered')
+
+    def test_valid_transitions_apply_and_are_recorded(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.post(
+            '/api/cart/orders/transition/', {'ids': [self.pending.pk], 'status': 'processing', 'note': 'packed'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['moved'], [self.pending.pk])
+        self.pending.refresh_from_db()
+        self.assertEqual(self.pending.status, 'processing')
+        event = OrderEvent.objects.get()
+        self.assertEqual(
+            (event.order_id, event.from_status, event.to_status, event.actor, event.note),
+            (self.pending.pk, 'pending', 'processing', self.admin, 'packed'),
+        )
+
+    def test_invalid_transitions_are_reported_per_order(self):
+        moved, failed = transition_orders([self.pending.pk, self.delivered.pk, 999999], 'cancelled')
+        self.assertEqual(moved, [self.pending.pk])
+        self.assertEqual(failed, {
+            self.delivered.pk: "Cannot move from delivered to cancelled",
+            999999: "Order not found",
+        })
+        self.assertEqual(Order.objects.get(pk=self.delivered.pk).status, 'delivered')
+        self.assertEqual(OrderEvent.objects.count(), 1)
+
+    def test_concurrent_change_is_not_applied_twice(self):
+        other = Order.objects.create(user=self.user, total_cost=100)
+        update = QuerySet.update
+        raced = []
+
+        def racing_update(queryset, **kwargs):
+            # Another transaction cancels one order between the read and the guarded UPDATE.
+            if queryset.model is Order and not raced:
+                raced.append(True)
+                update(Order.objects.filter(pk=other.pk), status='cancelled')
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=racing_update):
+            moved, failed = transition_orders([self.pending.pk, other.pk], 'processing')
+        self.assertEqual(moved, [self.pending.pk])
+        self.assertEqual(list(failed), [other.pk])
+        self.assertEqual(Order.objects.get(pk=other.pk).status, 'cancelled')
+        self.assertEqual(list(OrderEvent.objects.values_list('order_id', flat=True)), [self.pending.pk])
+
+
+    def test_move_between_allowed_sources_is_not_misrecorded(self):
+        other = Order.objects.create(user=self.user, total_cost=100)
+        update = QuerySet.update
+        raced = []
+
+        def racing_update(queryset, **kwargs):
+            # Another transaction moves one order on to processing, also a source of cancelled.
+            if queryset.model is Order and not raced:
+                raced.append(True)
+                update(Order.objects.filter(pk=other.pk), status='processing')
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=racing_update):
+            moved, failed = transition_orders([self.pending.pk, other.pk], 'cancelled')
+        self.assertEqual(moved, [self.pending.pk])
+        self.assertEqual(failed, {other.pk: "Order was changed concurrently"})
+        self.assertEqual(Order.objects.get(pk=other.pk).status, 'processing')
+        self.assertEqual(
+            list(OrderEvent.objects.values_list('order_id', 'from_status')), [(self.pending.pk, 'pending')],
+        )
+
+class AbandonedCartTests(TestCase):
+    def setUp(self):
+        brand = Brand.objects.create(name="Brand")
+        self.suit = Product.objects.create(name="Suit", description="-", price=1000, stock=20, brand=brand)
+        self.shawl = Product.objects.create(name="Shawl", description="-", price=500, stock=20, brand=brand)
+
+    def cart(self, username, idle, **quantities):
+        client = APIClient()
+        client.force_authenticate(get_user_model().objects.create_user(username=username))
+        for name, quantity in quantities.items():
+            client.post('/api/cart/add_to_cart/', {'product_id': getattr(self, name).pk, 'quantity': quantity})
+        cart = Cart.objects.get(user__username=username)
+        Cart.objects.filter(pk=cart.pk).update(updated_at=now() - timedelta(seconds=idle))
+        return cart
+
+    def stock(self):
+        return list(Product.objects.order_by('pk').values_list('stock', flat=True))
+
+    def test_idle_carts_give_their_stock_back(self):
+        idle = [self.cart("idle1", 7200, suit=2, shawl=1), self.cart("idle2", 7200, suit=3)]
+        active = self.cart("active", 60, shawl=4)
+        self.assertEqual(self.stock(), [15, 15])
+
+        self.assertEqual(release_abandoned_carts(3600, batch_size=1), (2, 6))
+        self.assertEqual(self.stock(), [20, 16])
+        self.assertFalse(CartItem.objects.filter(cart__in=idle).exists())
+        self.assertEqual([cart.item_count for cart in Cart.objects.filter(pk__in=[c.pk for c in idle])], [0, 0])
+        self.assertEqual(CartItem.objects.get(cart=active).quantity, 4)
+        self.assertEqual(release_abandoned_carts(3600), (0, 0))
+
+    def test_command(self):
+        self.cart("idle", 7200, suit=2)
+        out = io.StringIO()
+        call_command('release_abandoned_carts', ttl=3600, stdout=out)
+        self.assertIn("Released 2 units from 1 abandoned carts", out.getvalue())
+        self.assertEqual(self.stock(), [20, 20])
+
+
+class CartTotalsTests(TestCase):
+    def setUp(self):
+        brand = Brand.objects.create(name="Brand")
+        self.suit = Product.objects.create(
+            name="Suit", description="-", price=1000, discount_percentage=10, stock=20, brand=brand,
+        )
+        self.shawl = Product.objects.create(name="Shawl", description="-", price=500, stock=20, brand=brand)
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(username="shopper"))
+
+    def summary(self):
+        data = self.client.get('/api/cart/summary/').json()
+        return data['item_count'], Decimal(str(data['subtotal']))
+
+    def test_every_mutation_keeps_totals_current(self):
+        self.assertEqual(self.summary(), (0, 0))
+        self.client.post('/api/cart/add_to_cart/', {'product_id': self.suit.pk, 'quantity': 2})
+        self.client.post('/api/cart/add_to_cart/', {'product_id': self.shawl.pk, 'quantity': 1})
+        self.assertEqual(self.summary(), (3, 2300))
+        self.client.post('/api/cart/update_quantity/', {'product_id': self.shawl.pk, 'quantity': 3})
+        self.assertEqual(self.summary(), (5, 3300))
+        self.client.post('/api/cart/remove_from_cart/', {'product_id': self.suit.pk, 'quantity': 1})
+        self.assertEqual(self.summary(), (4, 2400))
+        self.client.post('/api/cart/clear_cart/')
+        self.assertEqual(self.summary(), (0, 0))
+
+    def test_reconcile_finds_and_fixes_price_drift(self):
+        self.client.post('/api/cart/add_to_cart/', {'product_id': self.shawl.pk, 'quantity': 2})
+        self.assertEqual(reconcile_totals(), [])
+        Product.objects.filter(pk=self.shawl.pk).update(price=600, discounted_price=600)
+        cart = Cart.objects.get()
+        self.assertEqual(reconcile_totals(batch_size=1), [cart.pk])
+        self.assertEqual(self.summary(), (2, 1000))
+        self.assertEqual(reconcile_totals(fix=True), [cart.pk])
+        self.assertEqual(self.summary(), (2, 1200))
+        self.assertEqual(reconcile_totals(), [])
+
+
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="shopper")
+        other = get_user_model().objects.create_user(username="other")
+        start = now()
+        self.orders = []
+        for i in range(25):
+            order = Order.objects.create(user=self.user, total_cost=100)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_name="Suit", product_price=50, quantity=1, product_data={'id': 1}),
+                OrderItem(order=order, product_name="Shawl", product_price=25, quantity=2, product_data={'id': 2}),
+            ])
+            self.orders.append(order)
+        # Pairs share a timestamp, so pages split ties and the id decides.
+        for i, order in enumerate(self.orders):
+            Order.objects.filter(pk=order.pk).update(created_at=start - timedelta(minutes=i // 2))
+        Order.objects.create(user=other, total_cost=100)
+        newest = Order.objects.filter(user=self.user).order_by('-created_at', '-id')
+        self.newest = list(newest.values_list('pk', flat=True))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_plain_list_is_the_20_newest(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/cart/orders/')
+        data = response.json()
+        self.assertEqual([order['id'] for order in data], self.newest[:20])
+        self.assertEqual(data[0]['item_count'], 3)
+        self.assertEqual(Decimal(data[0]['total_amount']), 100)
+
+    def test_keyset_pages_walk_every_order_once(self):
+        seen = []
+        response = self.client.get('/api/cart/orders/', {'page_size': 7})
+        while True:
+            seen += [order['id'] for order in response.json()['results']]
+            if not response.json()['next']:
+                break
+            response = self.client.get(response.json()['next'])
+        self.assertEqual(seen, self.newest)
+        previous = self.client.get(response.json()['previous']).json()
+        self.assertEqual([order['id'] for order in previous['results']], self.newest[14:21])
+
+    def test_detail_reads_line_snapshots(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/cart/orders/{self.orders[0].pk}/')
+        items = response.json()['items']
+        self.assertEqual([(item['product_name'], item['quantity']) for item in items], [("Suit", 1), ("Shawl", 2)])
+        self.assertEqual(items[0]['product'], {'id': 1})
+        other = Order.objects.exclude(user=self.user).get()
+        self.assertEqual(self.client.get(f'/api/cart/orders/{other.pk}/').status_code, 404)
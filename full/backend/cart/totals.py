@@ -0,0 +1,60 @@
+"""
+``Cart.item_count`` and ``Cart.subtotal``.
+
+Each cart mutation ends with :func:`update_totals`, a single ``UPDATE``
+that recomputes both from the cart's lines inside the same transaction, so
+the stored totals always match the lines they were written with. Product
+price changes made after that show up as drift, which
+``manage.py reconcile_cart_totals`` finds and fixes.
+"""
+from decimal import Decimal
+
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, NullIf
+
+from .models import Cart, CartItem
+
+# The same price the cart serializers charge: the discounted one when set.
+LINE_PRICE = Coalesce(NullIf(F('product__discounted_price'), Value(0)), F('product__price'))
+
+
+def item_count_subquery():
+    lines = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    return Coalesce(Subquery(lines.annotate(total=Sum('quantity')).values('total')), 0)
+
+
+def subtotal_subquery():
+    lines = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    total = Sum(F('quantity') * LINE_PRICE, output_field=DecimalField(max_digits=12, decimal_places=2))
+    return Coalesce(
+        Subquery(lines.annotate(total=total).values('total')), Value(Decimal('0')),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+def update_totals(cart_id):
+    Cart.objects.filter(pk=cart_id).update(item_count=item_count_subquery(), subtotal=subtotal_subquery())
+
+
+def reconcile_totals(batch_size=1000, fix=False):
+    """
+    Compare stored totals with the lines, ``batch_size`` carts per query.
+    Returns the ids of drifted carts; with ``fix=True`` they're recomputed.
+    """
+    drifted = []
+    last_pk = 0
+    while True:
+        carts = list(
+            Cart.objects.filter(pk__gt=last_pk).order_by('pk')
+            .annotate(actual_count=item_count_subquery(), actual_subtotal=subtotal_subquery())
+            .values_list('pk', 'item_count', 'subtotal', 'actual_count', 'actual_subtotal')[:batch_size]
+        )
+        if not carts:
+            break
+        last_pk = carts[-1][0]
+        batch = [pk for pk, count, subtotal, actual_count, actual_subtotal in carts
+                 if count != actual_count or subtotal != actual_subtotal]
+        if fix and batch:
+            Cart.objects.filter(pk__in=batch).update(item_count=item_count_subquery(), subtotal=subtotal_subquery())
+        drifted += batch
+    return drifted
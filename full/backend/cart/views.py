@@ -1,177 +1,355 @@
 from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
-from django.db import transaction
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from django.db import IntegrityError, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from .checkout import EmptyCart, place_order
+from .inventory import InsufficientStock, adjust_stock, lock_cart, release, release_items, reserve
 from .models import Cart, CartItem, Order, OrderItem, WishlistItem
+from .order_status import STATUSES, TRANSITION_MAX_ORDERS, transition_orders
+from .rollups import ROLLUPS
+from .totals import update_totals
 from .serializers import (
     CartSerializer, CartItemSerializer,
-    OrderSerializer, OrderItemSerializer,
+    OrderListSerializer, OrderSerializer, OrderItemSerializer,
     WishlistItemSerializer
 )
 from store.models import Product
+from store.counters import incr
+from store.idempotency import idempotent
+from store.pagination import OrderCursorPagination, paginated_response
+from store.prefetch import EagerLoadingMixin
+from django.utils.decorators import method_decorator
+from datetime import date, timedelta
+from django.utils.timezone import localdate
 import logging
 
 logger = logging.getLogger(__name__)
 
-class CartViewSet(viewsets.ModelViewSet):
+
+BATCH_MAX_OPERATIONS = 100
+SALES_REPORT_MAX_DAYS = 366
+SALES_REPORT_MAX_ROWS = 5000
+
+
+def _quantity(value):
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        return None
+    return quantity if quantity > 0 else None
+
+
+def _parse_operations(operations):
+    if not isinstance(operations, list) or not operations:
+        raise ValueError("operations must be a non-empty list")
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        raise ValueError(f"At most {BATCH_MAX_OPERATIONS} operations per request")
+    parsed = []
+    for i, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in ('add', 'remove', 'set'):
+            raise ValueError(f"operations[{i}]: op must be add, remove or set")
+        try:
+            product_id = int(operation.get('product_id'))
+        except (TypeError, ValueError):
+            raise ValueError(f"operations[{i}]: product_id must be an integer")
+        quantity = operation.get('quantity')
+        if operation['op'] == 'set':
+            quantity = _quantity(quantity) if quantity not in (0, '0') else 0
+        elif quantity is not None or operation['op'] == 'add':
+            quantity = _quantity(1 if quantity is None else quantity)
+        if quantity is None and operation['op'] != 'remove':
+            raise ValueError(f"operations[{i}]: quantity must be a positive integer")
+        parsed.append({'op': operation['op'], 'product_id': product_id, 'quantity': quantity})
+    return parsed
+
+
+class CartViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
-    queryset = Cart.objects.prefetch_related('items__product').all()
+    queryset = Cart.objects.all()
     serializer_class = CartSerializer
 
     def get_queryset(self):
-        return self.queryset.filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user)
 
     @action(detail=False, methods=['GET'])
     def get_cart(self, request):
-        cart, _ = Cart.objects.get_or_create(user=request.user)
+        cart = self.get_queryset().first()
+        if cart is None:
+            cart, _ = Cart.objects.get_or_create(user=request.user)
         serializer = self.get_serializer(cart)
         return Response(serializer.data)
 
     @action(detail=False, methods=['POST'])
+    @method_decorator(idempotent())
     def add_to_cart(self, request):
-        with transaction.atomic():
-            product_id = request.data.get('product_id')
-            quantity = int(request.data.get('quantity', 1))
-
-            if not product_id:
-                return Response({"detail": "Product ID is required"}, status=status.HTTP_400_BAD_REQUEST)
-
-            try:
-                product = Product.objects.select_for_update().get(id=product_id)
+        product_id = request.data.get('product_id')
+        quantity = _quantity(request.data.get('quantity', 1))
 
-                if product.stock < quantity:
-                    return Response({"detail": "Insufficient stock"}, status=status.HTTP_400_BAD_REQUEST)
+        if not product_id:
+            return Response({"detail": "Product ID is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if quantity is None:
+            return Response({"detail": "Quantity must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST)
 
+        try:
+            with transaction.atomic():
                 cart, _ = Cart.objects.get_or_create(user=request.user)
+                lock_cart(cart.pk)
                 cart_item, created = CartItem.objects.get_or_create(
                     cart=cart,
-                    product=product,
+                    product_id=product_id,
                     defaults={'quantity': quantity}
                 )
-
                 if not created:
-                    if cart_item.quantity + quantity > product.stock:
-                        return Response({"detail": "Exceeds available stock"}, status=status.HTTP_400_BAD_REQUEST)
-                    cart_item.quantity += quantity
-                    cart_item.save()
+                    CartItem.objects.filter(pk=cart_item.pk).update(quantity=F('quantity') + quantity)
+                update_totals(cart.pk)
 
-                product.stock -= quantity
-                product.save()
+                # Reserve last, so the product row is locked only until the commit.
+                if not reserve(product_id, quantity):
+                    raise InsufficientStock
+            cart_item.refresh_from_db(fields=['quantity'])
+            return Response(CartItemSerializer(cart_item).data, status=status.HTTP_201_CREATED)
 
-                return Response(CartItemSerializer(cart_item).data, status=status.HTTP_201_CREATED)
-
-            except Product.DoesNotExist:
+        except InsufficientStock:
+            if not Product.objects.filter(pk=product_id).exists():
                 return Response({"detail": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
-            except Exception as e:
-                logger.error(f"Cart error: {str(e)}", exc_info=True)
-                return Response({"detail": "Error processing request"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return Response({"detail": "Insufficient stock"}, status=status.HTTP_400_BAD_REQUEST)
+        except (IntegrityError, ValueError):
+            return Response({"detail": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+        except Exception as e:
+            logger.error(f"Cart error: {str(e)}", exc_info=True)
+            return Response({"detail": "Error processing request"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @action(detail=False, methods=['POST'])
     def remove_from_cart(self, request):
-        with transaction.atomic():
-            product_id = request.data.get('product_id')
-            quantity = int(request.data.get('quantity', 1))
+        product_id = request.data.get('product_id')
+        quantity = _quantity(request.data.get('quantity', 1))
+        if quantity is None:
+            return Response({"detail": "Quantity must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST)
 
+        with transaction.atomic():
             try:
-                product = Product.objects.select_for_update().get(id=product_id)
                 cart = Cart.objects.get(user=request.user)
-                cart_item = CartItem.objects.get(cart=cart, product=product)
-
-                if quantity >= cart_item.quantity:
-                    product.stock += cart_item.quantity
-                    cart_item.delete()
-                else:
-                    product.stock += quantity
-                    cart_item.quantity -= quantity
-                    cart_item.save()
-
-                product.save()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-
-            except (CartItem.DoesNotExist, Product.DoesNotExist):
+                lock_cart(cart.pk)
+                cart_item = CartItem.objects.get(cart=cart, product_id=product_id)
+            except (Cart.DoesNotExist, CartItem.DoesNotExist, ValueError):
                 return Response({"detail": "Item not found in cart"}, status=status.HTTP_404_NOT_FOUND)
 
+            released = min(quantity, cart_item.quantity)
+            if released == cart_item.quantity:
+                cart_item.delete()
+            else:
+                CartItem.objects.filter(pk=cart_item.pk).update(quantity=F('quantity') - released)
+            update_totals(cart.pk)
+            release(cart_item.product_id, released)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @action(detail=False, methods=['POST'])
     def clear_cart(self, request):
         try:
-            cart = Cart.objects.get(user=request.user)
-            for item in cart.items.all():
-                item.product.stock += item.quantity
-                item.product.save()
-            cart.items.all().delete()
+            with transaction.atomic():
+                cart = Cart.objects.get(user=request.user)
+                lock_cart(cart.pk)
+                release_items(cart.items.all())
+                cart.items.all().delete()
+                Cart.objects.filter(pk=cart.pk).update(item_count=0, subtotal=0)
             return Response({"detail": "Cart cleared"}, status=status.HTTP_200_OK)
         except Cart.DoesNotExist:
             return Response({"detail": "Cart not found"}, status=status.HTTP_404_NOT_FOUND)
 
     @action(detail=False, methods=['POST'])
     def update_quantity(self, request):
-        try:
-            product_id = request.data.get('product_id')
-            quantity = int(request.data.get('quantity', 1))
-
-            cart = Cart.objects.get(user=request.user)
-            cart_item = CartItem.objects.get(cart=cart, product_id=product_id)
-
-            product = cart_item.product
-            available_stock = product.stock + cart_item.quantity
-
-            if quantity > available_stock:
-                return Response({"detail": "Not enough stock"}, status=status.HTTP_400_BAD_REQUEST)
-
-            # Adjust stock
-            product.stock += cart_item.quantity
-            product.stock -= quantity
-            product.save()
+        product_id = request.data.get('product_id')
+        quantity = _quantity(request.data.get('quantity', 1))
+        if quantity is None:
+            return Response({"detail": "Quantity must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Update cart item
+        try:
+            with transaction.atomic():
+                cart = Cart.objects.get(user=request.user)
+                lock_cart(cart.pk)
+                cart_item = CartItem.objects.get(cart=cart, product_id=product_id)
+                change = quantity - cart_item.quantity
+                if change:
+                    CartItem.objects.filter(pk=cart_item.pk).update(quantity=quantity)
+                    update_totals(cart.pk)
+                if change > 0 and not reserve(cart_item.product_id, change):
+                    raise InsufficientStock
+                release(cart_item.product_id, -change)
             cart_item.quantity = quantity
-            cart_item.save()
-
             return Response(CartItemSerializer(cart_item).data, status=status.HTTP_200_OK)
 
-        except (Cart.DoesNotExist, CartItem.DoesNotExist):
+        except (Cart.DoesNotExist, CartItem.DoesNotExist, ValueError):
             return Response({"detail": "Cart or item not found"}, status=status.HTTP_404_NOT_FOUND)
+        except InsufficientStock:
+            return Response({"detail": "Not enough stock"}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             logger.error(f"Update quantity error: {str(e)}", exc_info=True)
             return Response({"detail": "Error updating quantity"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['POST'])
+    @method_decorator(idempotent())
+    def batch(self, request):
+        """
+        Apply ``{"operations": [{"op": "add" | "remove" | "set", "product_id": 1,
+        "quantity": 2}, ...]}`` in order, all or nothing. ``remove`` without a
+        quantity drops the line and ``set`` to 0 removes it. Answers with the
+        lines that changed.
+        """
+        try:
+            operations = _parse_operations(request.data.get('operations'))
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        changes = {}
+        try:
+            with transaction.atomic():
+                cart, _ = Cart.objects.get_or_create(user=request.user)
+                lock_cart(cart.pk)
+                product_ids = {operation['product_id'] for operation in operations}
+                items = {item.product_id: item for item in cart.items.filter(product_id__in=product_ids)}
+
+                quantities = {pk: item.quantity for pk, item in items.items()}
+                for operation in operations:
+                    pk, quantity = operation['product_id'], operation['quantity']
+                    current = quantities.get(pk, 0)
+                    if operation['op'] == 'add':
+                        current += quantity
+                    elif operation['op'] == 'set':
+                        current = quantity
+                    else:
+                        current = 0 if quantity is None else max(current - quantity, 0)
+                    quantities[pk] = current
+                for pk, quantity in quantities.items():
+                    previous = items[pk].quantity if pk in items else 0
+                    if quantity != previous:
+                        changes[pk] = quantity - previous
+
+                new = [pk for pk in changes if pk not in items and quantities[pk]]
+                missing = sorted(set(new) - set(Product.objects.filter(pk__in=new).values_list('pk', flat=True)))
+                if missing:
+                    return Response(
+                        {"detail": "Product not found", "products": missing}, status=status.HTTP_404_NOT_FOUND,
+                    )
+                CartItem.objects.bulk_create([CartItem(cart=cart, product_id=pk, quantity=quantities[pk]) for pk in new])
+                updated = [items[pk] for pk in changes if pk in items and quantities[pk]]
+                for item in updated:
+                    item.quantity = quantities[item.product_id]
+                CartItem.objects.bulk_update(updated, ['quantity'])
+                CartItem.objects.filter(pk__in=[items[pk].pk for pk in changes if pk in items and not quantities[pk]]).delete()
+                if changes:
+                    update_totals(cart.pk)
+
+                # One conditional UPDATE takes and returns the stock, locking products in id order.
+                if not adjust_stock({pk: -change for pk, change in changes.items()}):
+                    raise InsufficientStock
+
+        except InsufficientStock:
+            wanted = {pk: change for pk, change in changes.items() if change > 0}
+            stock = dict(Product.objects.filter(pk__in=wanted).values_list('pk', 'stock'))
+            missing = sorted(pk for pk in wanted if pk not in stock)
+            if missing:
+                return Response({"detail": "Product not found", "products": missing}, status=status.HTTP_404_NOT_FOUND)
+            short = sorted(pk for pk, change in wanted.items() if stock[pk] < change)
+            return Response({"detail": "Insufficient stock", "products": short}, status=status.HTTP_400_BAD_REQUEST)
+        except IntegrityError:
+            # A product deleted between the check above and the insert.
+            return Response({"detail": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        totals = Cart.objects.filter(pk=cart.pk).values('item_count', 'subtotal').get()
+        return Response({
+            "changes": [
+                {"product_id": pk, "quantity": quantities[pk], "change": change}
+                for pk, change in sorted(changes.items())
+            ],
+            **totals,
+        })
+
+    @action(detail=False, methods=['GET'])
+    def summary(self, request):
+        """Item count and subtotal for the header badge, straight from the cart row."""
+        totals = Cart.objects.filter(user=request.user).values('item_count', 'subtotal').first()
+        return Response(totals or {"item_count": 0, "subtotal": 0})
+
 # --- Order View ---
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(EagerLoadingMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    restrict_columns = True
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return super().get_queryset().filter(user=self.request.user)
+
+    def list(self, request):
+        """The newest orders as a plain list, or cursor pages with ?page_size / ?cursor."""
+        item_count = (
+            OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+            .annotate(total=Sum('quantity')).values('total')
+        )
+        queryset = Order.objects.filter(user=request.user).annotate(item_count=Coalesce(Subquery(item_count), 0))
+        return paginated_response(
+            request, queryset, OrderListSerializer, OrderCursorPagination, limit=OrderCursorPagination.page_size,
+        )
 
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    @method_decorator(idempotent())
     def place_order(self, request):
-        user = request.user
-        cart = Cart.objects.filter(user=user).first()
-        if not cart or cart.items.count() == 0:
-            return Response({"detail": "Cart is empty"}, status=400)
-
-        order = Order.objects.create(user=user)
-        for item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                product=item.product,
-                quantity=item.quantity,
-                price=item.product.discounted_price or item.product.price
+        key = request.headers.get('Idempotency-Key', '').strip()
+        try:
+            order, created = place_order(
+                request.user,
+                idempotency_key=key or None,
+                shipping_address=request.data.get('shipping_address'),
+                payment_method=request.data.get('payment_method'),
+            )
+        except EmptyCart:
+            return Response({"detail": "Cart is empty"}, status=status.HTTP_400_BAD_REQUEST)
+        except IntegrityError:
+            if not key:
+                raise
+            # A concurrent request with the same key won the insert.
+            order, created = Order.objects.get(user=request.user, idempotency_key=key), False
+        return Response(
+            {"success": "Order placed successfully", "order_id": order.pk, "total_cost": order.total_cost},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def transition(self, request):
+        """Move many orders to one status: {"ids": [...], "status": "shipped", "note": ""}."""
+        to_status = request.data.get('status')
+        ids = request.data.get('ids')
+        if to_status not in STATUSES:
+            return Response({"detail": f"status must be one of {', '.join(STATUSES)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(ids, list) or not ids or len(ids) > TRANSITION_MAX_ORDERS:
+            return Response(
+                {"detail": f"ids must be a list of 1 to {TRANSITION_MAX_ORDERS} order ids"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-        cart.items.all().delete()
-        return Response({"success": "Order placed successfully"})
+        try:
+            ids = [int(pk) for pk in ids]
+        except (TypeError, ValueError):
+            return Response({"detail": "ids must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        moved, failed = transition_orders(ids, to_status, actor=request.user, note=str(request.data.get('note', ''))[:255])
+        return Response({
+            "status": to_status,
+            "moved": moved,
+            "failed": [{"id": pk, "detail": reason} for pk, reason in sorted(failed.items())],
+        })
 
-            
 
 # --- Wishlist View ---
-class WishlistViewSet(viewsets.ModelViewSet):
+class WishlistViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
+    queryset = WishlistItem.objects.all()
     serializer_class = WishlistItemSerializer
 
     def get_queryset(self):
-        return WishlistItem.objects.filter(user=self.request.user).select_related('product')
+        return super().get_queryset().filter(user=self.request.user)
     
     def list(self, request):  # 👈 Add this
         queryset = self.get_queryset()
@@ -188,7 +366,47 @@ class WishlistViewSet(viewsets.ModelViewSet):
             wishlist_item, created = WishlistItem.objects.get_or_create(user=request.user, product=product)
             if not created:
                 return Response({"detail": "Product already in wishlist"}, status=status.HTTP_200_OK)
+            incr('wishlist_count', product.pk)
 
             return Response(self.get_serializer(wishlist_item).data, status=status.HTTP_201_CREATED)
         except Product.DoesNotExist:
             return Response({"detail": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
+
+
+# --- Analytics ---
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def sales_report(request):
+    """
+    Daily units and revenue from the rollup tables: ?by=brand|category|product,
+    ?start / ?end (YYYY-MM-DD, default the last 30 days) and an optional ?id.
+    """
+    by = request.query_params.get('by', 'brand')
+    if by not in ROLLUPS:
+        return Response({"detail": f"by must be one of {', '.join(ROLLUPS)}"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        end = date.fromisoformat(request.query_params['end']) if 'end' in request.query_params else localdate()
+        start = date.fromisoformat(request.query_params['start']) if 'start' in request.query_params else end - timedelta(days=29)
+        key = int(request.query_params['id']) if 'id' in request.query_params else None
+    except ValueError:
+        return Response({"detail": "start and end must be YYYY-MM-DD dates and id an integer"}, status=status.HTTP_400_BAD_REQUEST)
+    if not start <= end <= start + timedelta(days=SALES_REPORT_MAX_DAYS - 1):
+        return Response(
+            {"detail": f"end must be on or after start, at most {SALES_REPORT_MAX_DAYS} days later"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    model, field = ROLLUPS[by]
+    rows = model.objects.filter(day__range=(start, end))
+    if key is not None:
+        rows = rows.filter(**{field: key})
+    rows = rows.order_by('day', field).values_list('day', field, 'name', 'units', 'revenue')[:SALES_REPORT_MAX_ROWS]
+    return Response({
+        "by": by,
+        "start": start,
+        "end": end,
+        "results": [
+            {"day": day, "id": pk, "name": name, "units": units, "revenue": revenue}
+            for day, pk, name, units, revenue in rows
+        ],
+    })
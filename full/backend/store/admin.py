@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Product, Brand, ProductImage, Category, Review, ProductType, Color
+from .models import Product, Brand, ProductImage, Category, Review, ProductType, Color, Job
 from django.utils.html import format_html
 
 # Brand Admin with logo preview
@@ -54,7 +54,7 @@ class ProductAdmin(admin.ModelAdmin):
         "name", "brand", "fabric_type", "work_type", "occasion",
         "primary_color", "get_available_colors", "price", "discounted_price", "stock"
     )
-    readonly_fields = ("slug", "discounted_price")
+    readonly_fields = ("slug", "discounted_price", "sales_count")
     list_filter = (
         "brand", "category", "fabric_type", "work_type", "occasion",
         ColorFilter, "is_featured", "is_best_seller"
@@ -100,6 +100,13 @@ class ReviewAdmin(admin.ModelAdmin):
     search_fields = ("customer_name", "product__name", "comment")
     readonly_fields = ("created_at",)
 
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "status", "attempts", "run_at", "locked_by", "updated_at")
+    list_filter = ("status", "name")
+    readonly_fields = (
+        "name", "payload", "attempts", "max_attempts", "locked_by", "locked_at", "last_error", "created_at", "updated_at",
+    )
+
 # Register all models
 admin.site.register(Color)
 admin.site.register(Brand, BrandAdmin)
@@ -108,3 +115,4 @@ admin.site.register(ProductType, ProductTypeAdmin)
 admin.site.register(Product, ProductAdmin)
 admin.site.register(ProductImage)
 admin.site.register(Review, ReviewAdmin)
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,107 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+VERSION_KEY = 'catalog:version'
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def get_catalog_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog response."""
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 2, timeout=None)
+
+
+def touch_model(model):
+    """Record that rows of ``model`` changed just now."""
+    get_cache().set(_modified_key(model), time.time(), timeout=None)
+
+
+def get_model_modified(*models):
+    """Latest change time (epoch seconds) across ``models``."""
+    cache = get_cache()
+    stamps = []
+    for model in models:
+        key = _modified_key(model)
+        stamp = cache.get(key)
+        if stamp is None:
+            # Unknown after a cache flush: assume it changed now rather than never.
+            cache.add(key, time.time(), timeout=None)
+            stamp = cache.get(key, time.time())
+        stamps.append(stamp)
+    return max(stamps)
+
+
+def catalog_cache(timeout=None, stale_timeout=None, lock_timeout=30):
+    """
+    Cache a read-only catalog view's response data.
+
+    Entries are keyed on the view, host and query string and stamped with the
+    catalog version, so a version bump makes every entry stale at once. When
+    an entry is stale one worker takes a short lock and recomputes it; the
+    others keep serving the stale copy meanwhile instead of piling onto the
+    database.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            fresh_for = timeout if timeout is not None else getattr(settings, 'CATALOG_CACHE_TIMEOUT', 300)
+            keep_for = fresh_for + (stale_timeout if stale_timeout is not None else fresh_for * 12)
+            cache = get_cache()
+            key = _response_key(view, request, args, kwargs)
+            version = get_catalog_version()
+
+            entry = cache.get(key)
+            if entry is not None and entry['version'] == version and entry['expires'] > time.time():
+                return Response(entry['data'], status=entry['status'])
+
+            lock_key = key + ':lock'
+            if not cache.add(lock_key, 1, timeout=lock_timeout):
+                if entry is not None:
+                    return Response(entry['data'], status=entry['status'])
+                return view(request, *args, **kwargs)
+
+            try:
+                response = view(request, *args, **kwargs)
+                if response.status_code in (200, 404):
+                    cache.set(key, {
+                        'version': version,
+                        'expires': time.time() + fresh_for,
+                        'status': response.status_code,
+                        'data': response.data,
+                    }, timeout=keep_for)
+                return response
+            finally:
+                cache.delete(lock_key)
+        return wrapper
+    return decorator
+
+
+def _modified_key(model):
+    return f'catalog:modified:{model._meta.label_lower}'
+
+
+def _response_key(view, request, args, kwargs):
+    params = sorted(request.query_params.lists())
+    raw = repr((request.scheme, request.get_host(), args, sorted(kwargs.items()), params))
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f'catalog:response:{view.__module__}.{view.__name__}:{digest}'
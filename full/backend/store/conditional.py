@@ -0,0 +1,76 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .cache import get_model_modified
+from .models import Brand, Category, Color, Product, ProductImage, ProductType, RelatedProduct
+
+PRODUCT_LIST_MODELS = (Product, ProductImage, Brand, Category, Color, ProductType)
+PRODUCT_RELATED_MODELS = (Brand, Category, Color, ProductType)
+
+
+def conditional_response(request, last_modified, view, *args, **kwargs):
+    """
+    Answer ``If-None-Match`` / ``If-Modified-Since`` from a change timestamp.
+
+    ``last_modified`` is an epoch timestamp (or ``None`` to skip the check).
+    The ETag hashes it together with the path, host and query string, so it
+    changes with the representation without ever rendering the body; a
+    matching request gets a 304 before ``view`` runs.
+    """
+    if last_modified is None or request.method not in ('GET', 'HEAD'):
+        return view(request, *args, **kwargs)
+
+    etag = quote_etag(_etag(request, last_modified))
+    last_modified = int(last_modified)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    response = view(request, *args, **kwargs)
+    if response.status_code == 200:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def conditional(last_modified_func):
+    """Decorator form of :func:`conditional_response` for function views."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            return conditional_response(request, last_modified_func(request, *args, **kwargs), view, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def product_list_modified(request, *args, **kwargs):
+    return get_model_modified(*PRODUCT_LIST_MODELS)
+
+
+def related_products_modified(request, *args, **kwargs):
+    return get_model_modified(*PRODUCT_LIST_MODELS, RelatedProduct)
+
+
+def category_list_modified(request, *args, **kwargs):
+    return get_model_modified(Category)
+
+
+def product_modified(request, **lookup):
+    """Row stamp of one product, bounded below by the models it embeds."""
+    try:
+        updated_at = Product.objects.filter(**lookup).values_list('updated_at', flat=True).first()
+    except (TypeError, ValueError):
+        return None
+    if updated_at is None:
+        return None
+    return max(updated_at.timestamp(), get_model_modified(*PRODUCT_RELATED_MODELS))
+
+
+def _etag(request, last_modified):
+    params = sorted(request.query_params.lists()) if hasattr(request, 'query_params') else sorted(request.GET.lists())
+    raw = repr((request.path, request.get_host(), params, last_modified))
+    return hashlib.sha1(raw.encode()).hexdigest()
@@ -0,0 +1,180 @@
+"""
+Write-behind product counters (``COUNTER_FIELDS``).
+
+Hot products would serialize every checkout, page view and wishlist add on
+their row if each bumped a counter itself. Instead :func:`incr` adds to an
+in-process buffer and a background thread flushes it every
+``COUNTER_FLUSH_INTERVAL`` seconds with one
+``UPDATE ... SET sales_count = sales_count + CASE id WHEN ... END, ...``
+per ``FLUSH_CHUNK_SIZE`` products. Updates are relative, so every worker
+process can flush its own buffer independently.
+
+With ``COUNTER_FLUSH_INTERVAL = 0`` no thread is started and increments
+wait for an explicit :meth:`CounterBuffer.flush`; tests that hit counting
+views run that way. The buffer is flushed again at interpreter exit, so a
+restart loses at most the increments of a worker that dies without exiting
+cleanly, i.e. one flush interval. A failed flush puts its increments back
+for the next one.
+
+Of the counters only ``sales_count`` is shown (product payloads) or sorted
+on (best sellers), so a flush that writes sales moves the products'
+``updated_at``, the ``Product`` change stamp and the catalog version, once
+per flush. View and wishlist counts are never served, and flushing them
+leaves every validator and cached response alone.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Case, F, Value, When
+from django.utils.timezone import now
+
+from .cache import bump_catalog_version, touch_model
+from .models import COUNTER_FIELDS, Product
+
+logger = logging.getLogger(__name__)
+
+FLUSH_CHUNK_SIZE = 500
+
+
+class CounterBuffer:
+    def __init__(self):
+        self._pending = defaultdict(lambda: defaultdict(int))
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self.flushes = 0
+        self.failures = 0
+        self.flushed_increments = 0
+        self.last_flush_at = None
+        self.last_flush_seconds = None
+
+    def incr(self, field, product_id, amount=1):
+        if field not in COUNTER_FIELDS:
+            raise ValueError(f"Unknown counter {field!r}")
+        if amount <= 0:
+            return
+        with self._lock:
+            self._pending[field][product_id] += amount
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+        self._ensure_flusher()
+
+    def flush(self):
+        """Write the buffered increments. Returns the number of products updated."""
+        with self._flush_lock:
+            with self._lock:
+                pending, oldest = self._pending, self._oldest
+                self._pending, self._oldest = defaultdict(lambda: defaultdict(int)), None
+            if not pending:
+                return 0
+            started = time.monotonic()
+            try:
+                updated = _write(pending)
+                if pending.get('sales_count'):
+                    touch_model(Product)
+                    bump_catalog_version()
+            except Exception:
+                self.failures += 1
+                with self._lock:
+                    for field, amounts in pending.items():
+                        for product_id, amount in amounts.items():
+                            self._pending[field][product_id] += amount
+                    self._oldest = min(filter(None, (oldest, self._oldest)), default=oldest)
+                raise
+            self.flushes += 1
+            self.flushed_increments += sum(sum(amounts.values()) for amounts in pending.values())
+            self.last_flush_at = time.time()
+            self.last_flush_seconds = round(time.monotonic() - started, 4)
+            return updated
+
+    def clear(self):
+        """Drop the buffered increments. Returns how many there were."""
+        with self._lock:
+            dropped = sum(sum(amounts.values()) for amounts in self._pending.values())
+            self._pending, self._oldest = defaultdict(lambda: defaultdict(int)), None
+        return dropped
+
+    def stats(self):
+        with self._lock:
+            pending = sum(len(amounts) for amounts in self._pending.values())
+            lag = round(time.monotonic() - self._oldest, 1) if self._oldest is not None else 0
+        return {
+            'pending_products': pending,
+            'lag_seconds': lag,
+            'flush_interval': _interval(),
+            'flushes': self.flushes,
+            'failures': self.failures,
+            'flushed_increments': self.flushed_increments,
+            'last_flush_age_seconds': round(time.time() - self.last_flush_at, 1) if self.last_flush_at else None,
+            'last_flush_seconds': self.last_flush_seconds,
+        }
+
+    def _ensure_flusher(self):
+        if self._thread is not None or not _interval():
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(_interval())
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Counter flush failed")
+            finally:
+                connections.close_all()
+
+
+def _write(pending):
+    # All chunks or none: a failed flush re-queues everything, so a partial write would count twice.
+    product_ids = sorted({product_id for amounts in pending.values() for product_id in amounts})
+    updated = 0
+    stamp = now()
+    with transaction.atomic():
+        for start in range(0, len(product_ids), FLUSH_CHUNK_SIZE):
+            chunk = product_ids[start:start + FLUSH_CHUNK_SIZE]
+            changes = {}
+            for field, amounts in pending.items():
+                whens = [When(pk=pk, then=Value(amounts[pk])) for pk in chunk if amounts.get(pk)]
+                if whens:
+                    changes[field] = F(field) + Case(*whens, default=Value(0))
+            sold = [pk for pk in chunk if pending.get('sales_count', {}).get(pk)]
+            if sold:
+                changes['updated_at'] = Case(When(pk__in=sold, then=Value(stamp)), default=F('updated_at'))
+            updated += Product.objects.filter(pk__in=chunk).update(**changes)
+    return updated
+
+
+def _interval():
+    return getattr(settings, 'COUNTER_FLUSH_INTERVAL', 10)
+
+
+_buffer = CounterBuffer()
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        _buffer.flush()
+    except DatabaseError as e:
+        # E.g. the test database is already gone; there is nothing left to retry with.
+        logger.warning("Dropped %d buffered counter increments at exit: %s", _buffer.clear(), e)
+    except Exception:
+        logger.exception("Counter flush at exit failed")
+
+
+def get_counters():
+    return _buffer
+
+
+def incr(field, product_id, amount=1):
+    _buffer.incr(field, product_id, amount)
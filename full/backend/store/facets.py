@@ -0,0 +1,137 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Count, F, Max, Min, Q
+
+from .models import Product
+
+DISCOUNT_THRESHOLDS = (10, 20, 30, 40, 50)
+VALUE_FIELDS = ('fabric_type', 'work_type', 'occasion')
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+def parse_filters(params):
+    """
+    Read the facet filters from query params into ``{dimension: value}``.
+
+    List dimensions take comma-separated values and match any of them.
+    Raises ``ValueError`` for malformed numbers.
+    """
+    filters = {}
+    for name in ('category', 'product_type', 'brand', 'color') + VALUE_FIELDS:
+        values = [value.strip() for value in params.get(name, '').split(',') if value.strip()]
+        if values:
+            filters[name] = values
+    price = (_decimal(params.get('price_min')), _decimal(params.get('price_max')))
+    if price != (None, None):
+        filters['price'] = price
+    if params.get('discount'):
+        filters['discount'] = int(params['discount'])
+    if params.get('in_stock'):
+        filters['in_stock'] = params['in_stock'].lower() in TRUE_VALUES
+    return filters
+
+
+def filter_q(filters, exclude=None):
+    """Combine every filter except ``exclude`` into one ``Q``."""
+    q = Q()
+    for name, value in filters.items():
+        if name == exclude:
+            continue
+        if name in ('category', 'product_type', 'brand'):
+            q &= Q(**{f'{name}__slug__in': value})
+        elif name == 'color':
+            through = Product.available_colors.through.objects.filter(color__name__in=value)
+            q &= Q(primary_color__name__in=value) | Q(pk__in=through.values('product_id'))
+        elif name in VALUE_FIELDS:
+            q &= Q(**{f'{name}__in': value})
+        elif name == 'price':
+            low, high = value
+            if low is not None:
+                q &= Q(discounted_price__gte=low)
+            if high is not None:
+                q &= Q(discounted_price__lte=high)
+        elif name == 'discount':
+            q &= Q(discount_percentage__gte=value)
+        elif name == 'in_stock':
+            q &= Q(stock__gt=0) if value else Q(stock=0)
+    return q
+
+
+def facet_counts(queryset, filters):
+    """
+    Count products per value of every dimension.
+
+    Each dimension is counted against all the *other* active filters, so a
+    selected brand still shows its sibling brands' counts. That's one
+    aggregate query per dimension (two for colours), however many values
+    each has.
+    """
+    def scoped(dimension):
+        return queryset.filter(filter_q(filters, exclude=dimension))
+
+    facets = {}
+    for name in ('category', 'product_type', 'brand'):
+        rows = (
+            scoped(name).exclude(**{f'{name}__isnull': True})
+            .values_list(f'{name}__slug', f'{name}__name')
+            .annotate(count=Count('id')).order_by('-count', f'{name}__name')
+        )
+        facets[name] = [{'slug': slug, 'name': label, 'count': count} for slug, label, count in rows]
+
+    for name in VALUE_FIELDS:
+        rows = scoped(name).values_list(name).annotate(count=Count('id')).order_by('-count', name)
+        facets[name] = [{'value': value, 'count': count} for value, count in rows]
+
+    facets['color'] = _color_counts(scoped('color'))
+
+    price = scoped('price').aggregate(min=Min('discounted_price'), max=Max('discounted_price'))
+    facets['price'] = price
+
+    discount = scoped('discount').aggregate(**{
+        str(threshold): Count('id', filter=Q(discount_percentage__gte=threshold))
+        for threshold in DISCOUNT_THRESHOLDS
+    })
+    facets['discount'] = [{'min': int(key), 'count': count} for key, count in discount.items()]
+
+    facets['in_stock'] = scoped('in_stock').aggregate(
+        in_stock=Count('id', filter=Q(stock__gt=0)),
+        out_of_stock=Count('id', filter=Q(stock=0)),
+    )
+    return facets
+
+
+def _color_counts(queryset):
+    # A product counts once per colour whether it is the primary or an available one:
+    # the primary colour is counted from the product row, the rest from the M2M rows.
+    counts = {}
+    primary = (
+        queryset.exclude(primary_color__isnull=True)
+        .values('primary_color_id', 'primary_color__name', 'primary_color__hex_code')
+        .annotate(count=Count('id')).order_by()
+    )
+    for row in primary:
+        counts[row['primary_color_id']] = {
+            'name': row['primary_color__name'], 'hex_code': row['primary_color__hex_code'], 'count': row['count'],
+        }
+    available = (
+        Product.available_colors.through.objects
+        .filter(product__in=queryset.values('pk'))
+        .exclude(product__primary_color=F('color'))
+        .values('color_id', 'color__name', 'color__hex_code')
+        .annotate(count=Count('product_id')).order_by()
+    )
+    for row in available:
+        entry = counts.setdefault(row['color_id'], {
+            'name': row['color__name'], 'hex_code': row['color__hex_code'], 'count': 0,
+        })
+        entry['count'] += row['count']
+    return sorted(counts.values(), key=lambda entry: (-entry['count'], entry['name']))
+
+
+def _decimal(value):
+    if value in (None, ''):
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"Invalid number: {value}")
@@ -0,0 +1,146 @@
+"""
+``Idempotency-Key`` support for mutating endpoints.
+
+A view opts in with :func:`idempotent`. The first request with a given key
+claims it by inserting an ``IdempotencyKey`` row, unique per owner and key.
+The owner is the user, or for anonymous requests a hash of the session, or
+without one of the client address and user agent, so anonymous callers
+don't share keys. The first request runs the view and stores its status and
+data on the row; a retry with the same key and body gets that response
+replayed instead of running the view again. A duplicate that arrives while
+the first request is still running polls the row until the response is
+stored, so the view never runs twice at once for one key. The same key with
+a different body is a client bug and gets a 422.
+
+Rows live for ``IDEMPOTENCY_KEY_TTL`` seconds and are deleted by
+``manage.py purge_idempotency_keys``. Requests without the header, and
+responses with a 5xx status (which the client should be able to retry), are
+not stored.
+"""
+import hashlib
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils.timezone import now
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 64
+
+
+def idempotent(wait_timeout=10, lock_timeout=60):
+    """
+    Decorator for function views (wrap methods with ``method_decorator``).
+
+    A duplicate waits up to ``wait_timeout`` seconds for the first request
+    before giving up with a 409; a claim older than ``lock_timeout`` seconds
+    with no response is taken to belong to a crashed worker and is taken over.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request.headers.get(HEADER, '').strip()
+            if not key or request.method in ('GET', 'HEAD', 'OPTIONS'):
+                return view(request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response(
+                    {"detail": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+
+            owner = _owner(request)
+            fingerprint = _fingerprint(request)
+            deadline = time.monotonic() + wait_timeout
+            delay = 0.05
+            while True:
+                record = _claim(owner, key, fingerprint)
+                if record is None:
+                    return _run(view, owner, key, request, *args, **kwargs)
+                if record.fingerprint != fingerprint:
+                    return Response(
+                        {"detail": f"{HEADER} was already used for a different request"},
+                        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    )
+                if record.status_code is not None:
+                    response = Response(record.response, status=record.status_code)
+                    response['Idempotent-Replayed'] = 'true'
+                    return response
+                if record.created_at < now() - timedelta(seconds=lock_timeout):
+                    IdempotencyKey.objects.filter(pk=record.pk, status_code__isnull=True).delete()
+                    continue
+                if time.monotonic() > deadline:
+                    return Response(
+                        {"detail": "A request with this key is still in progress"},
+                        status=status.HTTP_409_CONFLICT,
+                    )
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+        return wrapper
+    return decorator
+
+
+def purge_expired_keys(batch_size=1000):
+    """Delete expired keys, ``batch_size`` rows per statement. Returns the number deleted."""
+    deleted = 0
+    cutoff = now()
+    while True:
+        pks = list(IdempotencyKey.objects.filter(expires_at__lte=cutoff).values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=pks).delete()[0]
+
+
+def _claim(owner, key, fingerprint):
+    """Insert the key; returns None if this request now owns it, else the existing row."""
+    ttl = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 60 * 60 * 24)
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                owner=owner, key=key, fingerprint=fingerprint, expires_at=now() + timedelta(seconds=ttl),
+            )
+        return None
+    except IntegrityError:
+        pass
+    record = IdempotencyKey.objects.filter(owner=owner, key=key).first()
+    if record is None or record.expires_at <= now():
+        # Gone or expired since the insert failed: try again.
+        if record is not None:
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+        return _claim(owner, key, fingerprint)
+    return record
+
+
+def _run(view, owner, key, request, *args, **kwargs):
+    claimed = IdempotencyKey.objects.filter(owner=owner, key=key)
+    try:
+        response = view(request, *args, **kwargs)
+    except BaseException:
+        claimed.delete()
+        raise
+    if response.status_code >= 500:
+        claimed.delete()
+    else:
+        claimed.update(status_code=response.status_code, response=getattr(response, 'data', None))
+    return response
+
+
+def _owner(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return str(user.pk)
+    session = getattr(request, 'session', None)
+    client = session and session.session_key
+    if not client:
+        client = '\n'.join([request.META.get('REMOTE_ADDR', ''), request.META.get('HTTP_USER_AGENT', '')])
+    return 'anon:' + hashlib.sha256(client.encode()).hexdigest()[:27]
+
+
+def _fingerprint(request):
+    raw = b'\n'.join([request.method.encode(), request.path.encode(), request.body])
+    return hashlib.sha256(raw).hexdigest()
@@ -0,0 +1,168 @@
+"""
+A small database-backed job queue.
+
+Functions registered with :func:`task` are queued by name with
+:func:`enqueue`, which inserts a ``Job`` row in the caller's transaction:
+the job exists exactly when the work that asked for it was committed.
+``manage.py run_jobs`` runs any number of workers, in any number of
+processes; each claims due jobs with ``SELECT ... FOR UPDATE SKIP LOCKED``
+so workers never wait on or run each other's jobs.
+
+A job that raises is retried after an exponential backoff (with jitter)
+until ``max_attempts``, then left ``failed`` with its last error. A job
+whose worker died mid-run is queued again once its lock is older than
+``JOB_LOCK_TIMEOUT`` seconds, so tasks should be safe to run twice.
+
+With ``JOBS_RUN_INLINE = True`` jobs run in-process right after the
+enqueuing transaction commits instead, for development without a worker.
+"""
+import logging
+import os
+import random
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils.module_loading import autodiscover_modules
+from django.utils.timezone import now
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+BACKOFF_BASE = 10
+BACKOFF_MAX = 60 * 60
+
+
+def task(name=None, max_attempts=5):
+    """Register a function as a task; it is called with the job's payload as keyword arguments."""
+    def decorator(func):
+        func.task_name = name or f'{func.__module__}.{func.__name__}'
+        func.max_attempts = max_attempts
+        TASKS[func.task_name] = func
+        return func
+    return decorator
+
+
+def enqueue(func, delay=0, **payload):
+    """Queue ``func`` (a registered task) to run with ``payload``, no sooner than ``delay`` seconds from now."""
+    job = Job.objects.create(
+        name=func.task_name,
+        payload=payload,
+        max_attempts=func.max_attempts,
+        run_at=now() + timedelta(seconds=delay),
+    )
+    if getattr(settings, 'JOBS_RUN_INLINE', False):
+        transaction.on_commit(lambda: run_job(claim_job(job.pk)))
+    return job
+
+
+def claim_jobs(limit, worker=None):
+    """Lock up to ``limit`` due jobs for ``worker`` and mark them running."""
+    worker = worker or worker_name()
+    started = now()
+    with transaction.atomic():
+        _requeue_stale()
+        ids = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status='queued', run_at__lte=started)
+            .order_by('run_at', 'id')
+            .values_list('pk', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        Job.objects.filter(pk__in=ids).update(
+            status='running', locked_by=worker, locked_at=started, attempts=F('attempts') + 1, updated_at=started,
+        )
+    return list(Job.objects.filter(pk__in=ids).order_by('run_at', 'id'))
+
+
+def claim_job(pk, worker=None):
+    with transaction.atomic():
+        Job.objects.filter(pk=pk, status='queued').update(
+            status='running', locked_by=worker or worker_name(), locked_at=now(), attempts=F('attempts') + 1,
+            updated_at=now(),
+        )
+    return Job.objects.filter(pk=pk, status='running').first()
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome. Returns True if it succeeded."""
+    if job is None:
+        return False
+    func = _resolve(job.name)
+    try:
+        if func is None:
+            raise LookupError(f"Unknown task {job.name!r}")
+        func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job %s #%s failed (attempt %s/%s)", job.name, job.pk, job.attempts, job.max_attempts)
+        if job.attempts < job.max_attempts and func is not None:
+            delay = min(BACKOFF_BASE * 2 ** (job.attempts - 1), BACKOFF_MAX) * random.uniform(0.8, 1.2)
+            _finish(job, 'queued', last_error=error, run_at=now() + timedelta(seconds=delay))
+        else:
+            _finish(job, 'failed', last_error=error)
+        return False
+    _finish(job, 'succeeded', last_error='')
+    return True
+
+
+def run_worker(batch_size=10, sleep=1.0, once=False, worker=None):
+    """Claim and run jobs until interrupted (or, with ``once``, until none are due). Returns jobs run."""
+    autodiscover_modules('tasks')
+    worker = worker or worker_name()
+    processed = 0
+    while True:
+        jobs = claim_jobs(batch_size, worker)
+        for job in jobs:
+            run_job(job)
+        processed += len(jobs)
+        if not jobs:
+            if once:
+                return processed
+            connections.close_all()
+            time.sleep(sleep)
+
+
+def purge_jobs(older_than_days, batch_size=1000):
+    """Delete succeeded jobs finished more than ``older_than_days`` ago. Returns the number deleted."""
+    cutoff = now() - timedelta(days=older_than_days)
+    deleted = 0
+    while True:
+        ids = list(
+            Job.objects.filter(status='succeeded', updated_at__lt=cutoff).values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += Job.objects.filter(pk__in=ids).delete()[0]
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _requeue_stale():
+    timeout = getattr(settings, 'JOB_LOCK_TIMEOUT', 60 * 10)
+    stale = Job.objects.filter(status='running', locked_at__lt=now() - timedelta(seconds=timeout))
+    fields = {'locked_by': '', 'locked_at': None, 'last_error': 'Worker lock expired', 'updated_at': now()}
+    stale.filter(attempts__gte=F('max_attempts')).update(status='failed', **fields)
+    stale.update(status='queued', **fields)
+
+
+def _finish(job, status, **fields):
+    # Guarded by the lock, so a job re-queued as stale and picked up elsewhere isn't overwritten.
+    Job.objects.filter(pk=job.pk, status='running', locked_by=job.locked_by).update(
+        status=status, locked_at=None, updated_at=now(), **fields,
+    )
+
+
+def _resolve(name):
+    if name not in TASKS:
+        autodiscover_modules('tasks')
+    return TASKS.get(name)
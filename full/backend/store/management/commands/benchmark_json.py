@@ -0,0 +1,50 @@
+import timeit
+from io import BytesIO
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from backend.renderers import ORJSONParser, ORJSONRenderer, orjson
+from store.models import Product
+from store.prefetch import eager_load
+from store.serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+    help = "Time DRF's JSON renderer/parser against the orjson ones on a page of serialized products"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=500, help="Products per page")
+        parser.add_argument('--repeat', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError("orjson is not installed; ORJSONRenderer falls back to the stdlib renderer")
+        size, repeat = options['size'], options['repeat']
+        products = list(eager_load(Product.objects.order_by('-created_at'), ProductSerializer)[:size])
+        if not products:
+            raise CommandError("No products to render")
+        data = ProductSerializer(products, many=True).data
+        # Repeat rows to fill the page on small catalogs.
+        page = (list(data) * (size // len(data) + 1))[:size]
+
+        stock, fast = JSONRenderer().render(page), ORJSONRenderer().render(page)
+        if stock != fast:
+            raise CommandError("ORJSONRenderer output differs from JSONRenderer")
+        self.stdout.write(f"{size} products, {len(stock) / 1024:.0f} KiB, best of {repeat} runs")
+
+        rows = [
+            ('render', JSONRenderer().render, ORJSONRenderer().render, page),
+            ('parse', _parse(JSONParser()), _parse(ORJSONParser()), stock),
+        ]
+        for label, slow_func, fast_func, arg in rows:
+            slow = min(timeit.repeat(lambda: slow_func(arg), number=1, repeat=repeat)) * 1000
+            quick = min(timeit.repeat(lambda: fast_func(arg), number=1, repeat=repeat)) * 1000
+            self.stdout.write(
+                f"{label:<7} drf {slow:8.2f} ms   orjson {quick:8.2f} ms   {slow / quick:5.1f}x"
+            )
+
+
+def _parse(parser):
+    return lambda body: parser.parse(BytesIO(body), parser_context={'encoding': 'utf-8'})
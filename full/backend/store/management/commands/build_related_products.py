@@ -0,0 +1,19 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from store.recommendations import build_related_products
+
+
+class Command(BaseCommand):
+    help = "Recompute the \"customers also bought\" neighbours from orders, wishlists and carts"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=20, help="Neighbours kept per product")
+        parser.add_argument('--block-size', type=int, default=2000, help="Products scored per matrix block")
+
+    def handle(self, *args, **options):
+        try:
+            count = build_related_products(top_k=options['top_k'], block_size=options['block_size'])
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Stored {count} related products"))
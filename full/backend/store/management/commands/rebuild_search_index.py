@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from store.search import get_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index from the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        count = get_index().rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} products"))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from store.jobs import purge_jobs, run_worker
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs; start one per worker process"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10, help="Jobs claimed per query")
+        parser.add_argument('--sleep', type=float, default=1.0, help="Seconds to wait when no job is due")
+        parser.add_argument('--once', action='store_true', help="Exit when no job is due")
+        parser.add_argument('--purge-days', type=int, help="Delete succeeded jobs older than this many days and exit")
+
+    def handle(self, *args, **options):
+        if options['purge_days'] is not None:
+            deleted = purge_jobs(options['purge_days'])
+            self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} finished jobs"))
+            return
+        count = run_worker(batch_size=options['batch_size'], sleep=options['sleep'], once=options['once'])
+        self.stdout.write(self.style.SUCCESS(f"Ran {count} jobs"))
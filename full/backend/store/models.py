@@ -1,6 +1,7 @@
-from django.db import models
+from django.db import models, transaction
 from django.utils.text import slugify
 from django.utils.timezone import now
+from rest_framework.utils.encoders import JSONEncoder
 
 class Color(models.Model):
     name = models.CharField(max_length=50, unique=True)
@@ -66,6 +67,10 @@ class ProductType(models.Model):
     def __str__(self):
         return self.name
 
+RATING_FIELDS = ('rating_count', 'rating_sum', 'rating_1', 'rating_2', 'rating_3', 'rating_4', 'rating_5')
+COUNTER_FIELDS = ('sales_count', 'view_count', 'wishlist_count')
+
+
 class Product(models.Model):
     name = models.CharField(max_length=255)
     slug = models.SlugField(unique=True, blank=True, null=True, editable=False)
@@ -78,6 +83,7 @@ class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name="products")
     product_type = models.ForeignKey(ProductType, on_delete=models.SET_NULL, null=True, blank=True, related_name="products")
     created_at = models.DateTimeField(default=now)
+    updated_at = models.DateTimeField(auto_now=True)
 
     # Fabric Details
     kurta_fabric = models.CharField(max_length=255, default="Cotton")
@@ -98,10 +104,38 @@ class Product(models.Model):
     available_colors = models.ManyToManyField(Color, blank=True, related_name='products')
 
     # Features
-    sales_count = models.PositiveIntegerField(default=0)
+    # Counters only move through store.counters' batched relative updates.
+    sales_count = models.PositiveIntegerField(default=0, editable=False)
+    view_count = models.PositiveIntegerField(default=0, editable=False)
+    wishlist_count = models.PositiveIntegerField(default=0, editable=False)
     is_best_seller = models.BooleanField(default=False)
     is_trending = models.BooleanField(default=False)
     is_featured = models.BooleanField(default=False)
+
+    # Review stats, kept in step with Review rows by store.ratings
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        # One index per query shape in store/views.py. Each ends with id so the
+        # keyset cursor's (sort key, id) order is read straight off the index
+        # (backwards for descending sorts) instead of being sorted.
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='product_newest_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['discount_percentage', 'id'], name='product_discount_idx'),
+            models.Index(fields=['sales_count', 'id'], name='product_popularity_idx'),
+            models.Index(fields=['is_featured', 'created_at', 'id'], name='product_featured_newest_idx'),
+            models.Index(fields=['is_trending', 'created_at', 'id'], name='product_trending_newest_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], name='product_category_newest_idx'),
+            models.Index(fields=['product_type', 'created_at', 'id'], name='product_type_newest_idx'),
+        ]
+
     def get_absolute_url(self):
         from django.urls import reverse
         return reverse('product-detail', kwargs={'slug': self.slug})
@@ -119,6 +153,12 @@ class Product(models.Model):
             self.discounted_price = round(self.price - (self.price * self.discount_percentage / 100), 2)
         else:
             self.discounted_price = self.price
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Rating stats and counters only move through relative updates; never write back a stale copy.
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in RATING_FIELDS + COUNTER_FIELDS
+            ]
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -139,5 +179,84 @@ class Review(models.Model):
     comment = models.TextField()
     created_at = models.DateTimeField(default=now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'created_at', 'id'], name='review_product_newest_idx'),
+            models.Index(fields=['created_at', 'id'], name='review_newest_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The product's rating stats are updated by a post_save signal; keep both in one transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.customer_name} - {self.product.name}"
+
+
+class RelatedProduct(models.Model):
+    """One of a product's top-K "customers also bought" neighbours, rebuilt by store.recommendations."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="neighbours")
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="neighbour_of")
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='related_product_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} (#{self.rank})"
+
+
+class IdempotencyKey(models.Model):
+    """The stored response to a request sent with an ``Idempotency-Key`` header (see store.idempotency)."""
+    # The user id, or "anon:" and a hash of an anonymous client (see store.idempotency._owner).
+    owner = models.CharField(max_length=32)
+    key = models.CharField(max_length=64)
+    fingerprint = models.CharField(max_length=64)
+    # Both null while the first request is still running.
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=JSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'key'], name='idempotency_owner_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner}: {self.key}"
+
+
+class Job(models.Model):
+    """A unit of background work run by ``manage.py run_jobs`` (see store.jobs)."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, encoder=JSONEncoder)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # The dequeue query: due jobs of one status, oldest first.
+            models.Index(fields=['status', 'run_at', 'id'], name='job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
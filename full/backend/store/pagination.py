@@ -0,0 +1,257 @@
+import base64
+import json
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .prefetch import eager_load
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opaque cursor pagination over a unique composite sort key.
+
+    Every ordering ends with the primary key, so the cursor holds the full
+    sort key of the boundary row and the next page is a plain
+    ``WHERE (a, id) < (x, y)`` range scan: page 500 costs the same as page 1.
+
+    Pagination is opt-in: the list stays a plain array unless the client
+    sends ``cursor`` or ``page_size``, so existing clients keep working. The
+    plain array is still capped, at ``UNPAGINATED_MAX_ROWS`` rows (or
+    ``unpaginated_limit`` when lower), so no request loads a whole table.
+    """
+    page_size = 24
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    orderings = {'default': ('-id',)}
+    default_ordering = 'default'
+    invalid_cursor_message = 'Invalid cursor'
+    unpaginated_limit = None
+
+    def is_requested(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_unpaginated_limit(self):
+        limit = getattr(settings, 'UNPAGINATED_MAX_ROWS', 500)
+        return limit if self.unpaginated_limit is None else min(limit, self.unpaginated_limit)
+
+    def get_ordering_key(self, request):
+        key = request.query_params.get(self.ordering_query_param)
+        return key if key in self.orderings else self.default_ordering
+
+    def get_ordering(self, request):
+        return self.orderings[self.get_ordering_key(request)]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.paginated = self.is_requested(request)
+        if not self.paginated:
+            return list(queryset.order_by(*self.get_ordering(request))[:self.get_unpaginated_limit()])
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering_key = self.get_ordering_key(request)
+        self.ordering = self.orderings[self.ordering_key]
+        self.model = queryset.model
+
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor['r']
+        ordering = _flip(self.ordering) if reverse else self.ordering
+
+        queryset = with_keyset(queryset, ordering)
+        if cursor is not None:
+            queryset = queryset.filter(keyset_after(ordering, cursor['v']))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        if reverse:
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        if not self.paginated:
+            return Response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, row, reverse):
+        values = [_dump(value) for value in keyset_values(row, self.ordering)]
+        payload = json.dumps({'o': self.ordering_key, 'r': reverse, 'v': values}, separators=(',', ':'))
+        token = base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            token += '=' * (-len(token) % 4)
+            data = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+            if data['o'] != self.ordering_key or len(data['v']) != len(self.ordering):
+                raise ValueError
+            values = [
+                self.model._meta.get_field(name.lstrip('-')).to_python(value)
+                for name, value in zip(self.ordering, data['v'])
+            ]
+            return {'r': bool(data['r']), 'v': values}
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+
+class ProductCursorPagination(KeysetPagination):
+    # Each ordering is backed by a (sort key, id) index on Product; the
+    # field-style keys match the sort dropdown values the storefront sends.
+    orderings = {
+        'newest': ('-created_at', '-id'),
+        'price_asc': ('price', 'id'),
+        'price_desc': ('-price', '-id'),
+        'discount': ('-discount_percentage', '-id'),
+        'popularity': ('-sales_count', '-id'),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+        '-discount_percentage': ('-discount_percentage', '-id'),
+        '-sales_count': ('-sales_count', '-id'),
+    }
+    default_ordering = 'newest'
+
+
+class BestSellerCursorPagination(ProductCursorPagination):
+    page_size = 10
+    default_ordering = 'popularity'
+
+
+class NameCursorPagination(KeysetPagination):
+    page_size = 50
+    orderings = {'name': ('name', 'id')}
+    default_ordering = 'name'
+
+
+class ReviewCursorPagination(KeysetPagination):
+    # Filtered by product, this walks the (product, created_at, id) index.
+    page_size = 10
+    orderings = {'newest': ('-created_at', '-id')}
+    default_ordering = 'newest'
+
+
+class OrderCursorPagination(KeysetPagination):
+    # Filtered by user, this walks the (user, created_at, id) index on Order.
+    page_size = 20
+    orderings = {'newest': ('-created_at', '-id')}
+    default_ordering = 'newest'
+
+
+class IdCursorPagination(KeysetPagination):
+    orderings = {'id': ('id',)}
+    default_ordering = 'id'
+
+
+def paginated_response(request, queryset, serializer_class, pagination_class=ProductCursorPagination,
+                       context=None, fields=None, limit=None):
+    """
+    Serialize ``queryset`` for a read-only function view, paginating it when
+    the client asks to. ``fields`` is forwarded to sparse-fieldset serializers
+    and ``limit`` lowers the cap on the unpaginated response.
+    """
+    kwargs = {'context': context or {'request': request}}
+    if fields:
+        kwargs['fields'] = fields
+    queryset = eager_load(queryset, serializer_class(**kwargs), only=True)
+    paginator = pagination_class()
+    paginator.unpaginated_limit = limit
+    page = paginator.paginate_queryset(queryset, request)
+    return paginator.get_paginated_response(serializer_class(page, many=True, **kwargs).data)
+
+
+def _key_attr(index):
+    return f'keyset_{index}'
+
+
+def _dump(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _flip(ordering):
+    return tuple(name[1:] if name.startswith('-') else '-' + name for name in ordering)
+
+
+def with_keyset(queryset, ordering):
+    """
+    Order ``queryset`` by ``ordering`` and carry the sort key as annotations,
+    so it survives a deferring ``.only()``; read it back with :func:`keyset_values`.
+    """
+    return queryset.order_by(*ordering).annotate(**{
+        _key_attr(i): F(name.lstrip('-')) for i, name in enumerate(ordering)
+    })
+
+
+def keyset_values(row, ordering):
+    """The sort key of a row fetched through :func:`with_keyset`."""
+    return [getattr(row, _key_attr(i)) for i in range(len(ordering))]
+
+
+def keyset_after(ordering, values):
+    """Lexicographic "row comes after the cursor" filter for the given ordering."""
+    condition = Q()
+    prefix = Q()
+    for name, value in zip(ordering, values):
+        field = name.lstrip('-')
+        lookup = 'lt' if name.startswith('-') else 'gt'
+        condition |= prefix & Q(**{f'{field}__{lookup}': value})
+        prefix &= Q(**{field: value})
+    return condition
@@ -0,0 +1,142 @@
+from django.db.models import Prefetch
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+_plans = {}
+
+
+class Plan:
+    """The joins, prefetches and columns a serializer reads."""
+
+    def __init__(self):
+        self.select = []
+        self.prefetch = {}
+        self.columns = []
+
+    def add_prefetch(self, lookup, override=False):
+        # A nested serializer's Prefetch carries its own plan, so it wins over a bare lookup.
+        if override or lookup.prefetch_to not in self.prefetch:
+            self.prefetch[lookup.prefetch_to] = lookup
+
+    def apply(self, queryset, only=False):
+        if self.select:
+            queryset = queryset.select_related(*dict.fromkeys(self.select))
+        if self.prefetch:
+            queryset = queryset.prefetch_related(*self.prefetch.values())
+        if only and self.columns:
+            queryset = queryset.only(*dict.fromkeys(self.columns))
+        return queryset
+
+
+def get_prefetch_plan(serializer, only=False):
+    """
+    Return the :class:`Plan` for a serializer class or instance.
+
+    Nested serializers are followed automatically: to-one relations are joined
+    and to-many relations become a ``Prefetch`` whose queryset carries the
+    child's own plan. Anything read outside a declared model field (e.g. from
+    a ``SerializerMethodField``) is declared on ``Meta.requires`` as
+    ``{field_name: [lookup, ...]}``, so dropping a field from a sparse
+    fieldset also drops what it needed.
+    """
+    if isinstance(serializer, type):
+        serializer = serializer()
+    key = (type(serializer), tuple(serializer.fields), only)
+    if key not in _plans:
+        plan = Plan()
+        _build_plan(serializer, serializer.Meta.model, '', plan, only)
+        _plans[key] = plan
+    return _plans[key]
+
+
+def eager_load(queryset, serializer, only=False):
+    """
+    Apply a serializer's plan to ``queryset``.
+
+    With ``only=True`` the query also selects just the columns the
+    serializer reads; use it on read paths only.
+    """
+    return get_prefetch_plan(serializer, only).apply(queryset, only)
+
+
+def _build_plan(serializer, model, prefix, plan, only):
+    requires = getattr(getattr(serializer, 'Meta', None), 'requires', {})
+
+    for name, field in serializer.fields.items():
+        if field.source == '*':
+            for lookup in requires.get(name, ()):
+                _add_lookup(model, lookup, prefix, plan)
+            continue
+        path = field.source.replace('.', '__')
+        if isinstance(field, ListSerializer):
+            child = field.child
+            queryset = _ordered(child.Meta.model)
+            child_plan = get_prefetch_plan(child, only)
+            if only:
+                child_plan = _with_columns(child_plan, _reverse_fk_name(model, path))
+            plan.add_prefetch(Prefetch(prefix + path, queryset=child_plan.apply(queryset, only)), override=True)
+        elif isinstance(field, BaseSerializer):
+            plan.select.append(prefix + path)
+            plan.columns.append(prefix + path)
+            related_model = model._meta.get_field(path).related_model
+            _build_plan(field, related_model, prefix + path + '__', plan, only)
+        else:
+            _add_lookup(model, path, prefix, plan)
+        for lookup in requires.get(name, ()):
+            _add_lookup(model, lookup, prefix, plan)
+
+
+def _add_lookup(model, lookup, prefix, plan):
+    """Classify a ``a__b__c`` lookup as a join, a prefetch or a plain column."""
+    parts = lookup.split('__')
+    for i, part in enumerate(parts):
+        path = prefix + '__'.join(parts[:i + 1])
+        try:
+            field = model._meta.get_field(part)
+        except Exception:
+            return
+        if field.many_to_many or field.one_to_many or field.is_relation and not field.concrete:
+            plan.add_prefetch(Prefetch(path, queryset=_ordered(field.related_model)))
+            return
+        if field.is_relation:
+            plan.select.append(path)
+            plan.columns.append(path)
+            model = field.related_model
+        else:
+            plan.columns.append(path)
+            return
+
+
+def _ordered(model):
+    # Prefetched rows come back in this order, so make it as stable as .first().
+    queryset = model._default_manager.all()
+    return queryset if queryset.ordered else queryset.order_by('pk')
+
+
+def _reverse_fk_name(model, path):
+    # A reverse FK prefetch matches children on their FK column, so it must be loaded.
+    field = model._meta.get_field(path)
+    return field.field.name if field.one_to_many else None
+
+
+def _with_columns(plan, column):
+    if not column or column in plan.columns:
+        return plan
+    extended = Plan()
+    extended.select = list(plan.select)
+    extended.prefetch = dict(plan.prefetch)
+    extended.columns = plan.columns + [column]
+    return extended
+
+
+class EagerLoadingMixin:
+    """
+    Apply the serializer's prefetch plan to the viewset queryset.
+
+    Set ``restrict_columns = True`` to also defer the columns the serializer
+    doesn't read on safe (read-only) requests.
+    """
+    restrict_columns = False
+
+    def get_queryset(self):
+        only = self.restrict_columns and self.request.method in ('GET', 'HEAD', 'OPTIONS')
+        return eager_load(super().get_queryset(), self.get_serializer(), only)
@@ -0,0 +1,92 @@
+"""
+Per-product review stats (count, sum and a 1-5 star histogram) stored on
+``Product`` so cards can show ratings without touching the review table.
+
+``store.signals`` applies each review save/delete as a relative update in
+the same transaction as the review row; :func:`rebuild_rating_stats`
+recomputes them from scratch.
+"""
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils.timezone import now
+
+from .cache import bump_catalog_version, touch_model
+from .models import RATING_FIELDS, Product, Review
+
+RATING_VALUES = (1, 2, 3, 4, 5)
+STATS_FIELDS = list(RATING_FIELDS)
+
+
+def apply_rating(product_id, rating, sign):
+    """Add (``sign=1``) or remove (``sign=-1``) one review's rating from its product's stats."""
+    if rating not in RATING_VALUES:
+        return
+    Product.objects.filter(pk=product_id).update(
+        rating_count=F('rating_count') + sign,
+        rating_sum=F('rating_sum') + sign * rating,
+        updated_at=now(),
+        **{f'rating_{rating}': F(f'rating_{rating}') + sign},
+    )
+    touch_model(Product)
+    bump_catalog_version()
+
+
+def rebuild_rating_stats(batch_size=1000):
+    """
+    Recompute every product's stats from its reviews, ``batch_size``
+    products per transaction. Each batch locks its product rows first, so
+    reviews written meanwhile wait and then apply on top of the new totals.
+    """
+    updated = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            products = list(
+                Product.objects.select_for_update().filter(pk__gt=last_pk).order_by('pk')
+                .only('pk', *STATS_FIELDS)[:batch_size]
+            )
+            if not products:
+                break
+            last_pk = products[-1].pk
+            stats = _aggregate([product.pk for product in products])
+            changed = []
+            for product in products:
+                values = stats.get(product.pk, {})
+                new = {name: values.get(name) or 0 for name in STATS_FIELDS}
+                if any(getattr(product, name) != value for name, value in new.items()):
+                    for name, value in new.items():
+                        setattr(product, name, value)
+                    product.updated_at = now()
+                    changed.append(product)
+            Product.objects.bulk_update(changed, STATS_FIELDS + ['updated_at'])
+            updated += len(changed)
+    if updated:
+        touch_model(Product)
+        bump_catalog_version()
+    return updated
+
+
+def _aggregate(product_ids):
+    rows = (
+        Review.objects.filter(product_id__in=product_ids, rating__in=RATING_VALUES)
+        .values('product_id')
+        .annotate(
+            rating_count=Count('id'),
+            rating_sum=Sum('rating'),
+            **{f'rating_{value}': Count('id', filter=Q(rating=value)) for value in RATING_VALUES},
+        )
+        .order_by()
+    )
+    return {row.pop('product_id'): row for row in rows}
+
+
+def rating_summary(product, histogram=False):
+    """The ``rating`` object shown on product cards (and, with the histogram, on the detail)."""
+    count = product.rating_count
+    summary = {
+        'average': round(product.rating_sum / count, 1) if count else None,
+        'count': count,
+    }
+    if histogram:
+        summary['histogram'] = {str(value): getattr(product, f'rating_{value}') for value in RATING_VALUES}
+    return summary
@@ -0,0 +1,107 @@
+"""
+Offline "customers also bought" neighbours.
+
+Every user is a vector over products (ordered, wishlisted or in the cart,
+weighted by ``INTERACTION_WEIGHTS``); two products are similar when the
+same users picked them, scored as the cosine between their columns. The
+item-item product is computed with scipy sparse matrices a block of items
+at a time, so memory stays bounded by the block rather than the catalog,
+and each product's top K neighbours are stored in ``RelatedProduct``.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+
+from cart.models import CartItem, OrderItem, WishlistItem
+
+from .cache import bump_catalog_version, touch_model
+from .models import Product, RelatedProduct
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # pragma: no cover
+    np = sparse = None
+
+INTERACTION_WEIGHTS = {'order': 1.0, 'wishlist': 0.5, 'cart': 0.5}
+# OrderItem keeps a JSON snapshot instead of a product FK; the id is stored under this key.
+SNAPSHOT_PRODUCT_KEY = 'id'
+
+
+def build_related_products(top_k=20, block_size=2000, batch_size=5000):
+    """Recompute every product's neighbours and swap them in atomically. Returns rows written."""
+    if sparse is None:
+        raise ImproperlyConfigured("numpy and scipy are required to build related products")
+
+    users, items, weights = load_interactions()
+    written = 0
+    with transaction.atomic():
+        RelatedProduct.objects.all().delete()
+        if len(users):
+            batch = []
+            for row in _neighbours(users, items, weights, top_k, block_size):
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    RelatedProduct.objects.bulk_create(batch)
+                    written += len(batch)
+                    batch = []
+            RelatedProduct.objects.bulk_create(batch)
+            written += len(batch)
+    touch_model(RelatedProduct)
+    bump_catalog_version()
+    return written
+
+
+def load_interactions():
+    """Return ``(user_ids, product_ids, weights)`` arrays for every known user-product interaction."""
+    dtype = [('user', 'i8'), ('product', 'i8')]
+    orders = OrderItem.objects.filter(**{f'product_data__{SNAPSHOT_PRODUCT_KEY}__isnull': False})
+    sources = [
+        ('order', (
+            (user, int(product)) for user, product
+            in orders.values_list('order__user_id', f'product_data__{SNAPSHOT_PRODUCT_KEY}').iterator(chunk_size=10000)
+        )),
+        ('wishlist', WishlistItem.objects.values_list('user_id', 'product_id').iterator(chunk_size=10000)),
+        ('cart', CartItem.objects.values_list('cart__user_id', 'product_id').iterator(chunk_size=10000)),
+    ]
+    users, items, weights = [], [], []
+    for name, rows in sources:
+        pairs = np.fromiter(rows, dtype=dtype)
+        users.append(pairs['user'])
+        items.append(pairs['product'])
+        weights.append(np.full(len(pairs), INTERACTION_WEIGHTS[name]))
+    users, items, weights = np.concatenate(users), np.concatenate(items), np.concatenate(weights)
+
+    # Order snapshots can outlive their product.
+    existing = np.fromiter(Product.objects.values_list('pk', flat=True).iterator(chunk_size=10000), dtype='i8')
+    keep = np.isin(items, existing)
+    return users[keep], items[keep], weights[keep]
+
+
+def _neighbours(users, items, weights, top_k, block_size):
+    _, user_index = np.unique(users, return_inverse=True)
+    product_ids, item_index = np.unique(items, return_inverse=True)
+    # Duplicate (user, product) entries are summed, e.g. bought and wishlisted.
+    matrix = sparse.csr_matrix((weights, (user_index, item_index)), shape=(user_index.max() + 1, len(product_ids)))
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0)).ravel())
+    matrix = (matrix @ sparse.diags(1 / norms)).tocsc()
+    transposed = matrix.T.tocsr()
+
+    for start in range(0, len(product_ids), block_size):
+        similarity = (transposed[start:start + block_size] @ matrix).tocsr()
+        for offset in range(similarity.shape[0]):
+            lo, hi = similarity.indptr[offset], similarity.indptr[offset + 1]
+            columns, scores = similarity.indices[lo:hi], similarity.data[lo:hi]
+            keep = columns != start + offset
+            columns, scores = columns[keep], scores[keep]
+            if len(scores) > top_k:
+                top = np.argpartition(-scores, top_k)[:top_k]
+                columns, scores = columns[top], scores[top]
+            order = np.lexsort((product_ids[columns], -scores))
+            product_id = int(product_ids[start + offset])
+            for rank, position in enumerate(order, 1):
+                yield RelatedProduct(
+                    product_id=product_id,
+                    related_id=int(product_ids[columns[position]]),
+                    rank=rank,
+                    score=float(scores[position]),
+                )
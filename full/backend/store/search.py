@@ -0,0 +1,241 @@
+"""
+Product search backed by a SQLite FTS5 index.
+
+The index lives in its own SQLite file (``settings.SEARCH_INDEX_PATH``) next
+to whatever database the catalog uses, so it runs the same locally and in
+production. FTS5 keeps the inverted index and ranks with BM25; on top of it
+each unknown query term is expanded to its single-edit neighbours from the
+index vocabulary so small typos still match.
+
+Every match is ranked, however old, so a near-universal term ("cotton")
+costs a BM25 score per matching product; FTS5 computes those in C without
+touching the catalog database. Queries are cut to ``MAX_QUERY_LENGTH``
+characters and ``MAX_QUERY_TERMS`` terms, and only terms up to
+``FUZZY_MAX_TERM_LENGTH`` characters are expanded, since the neighbour set
+grows with the term's length. ``store.signals`` keeps the index in
+step with ``Product`` saves and deletes; ``manage.py rebuild_search_index``
+rebuilds it from scratch.
+"""
+import re
+import sqlite3
+import string
+import threading
+import unicodedata
+
+from django.conf import settings
+
+from .models import Product
+
+# (column, bm25 weight); higher weight ranks matches in that column higher.
+COLUMNS = (
+    ('name', 10.0),
+    ('brand', 5.0),
+    ('category', 4.0),
+    ('product_type', 4.0),
+    ('fabric', 2.0),
+    ('work_type', 2.0),
+    ('occasion', 2.0),
+    ('description', 1.0),
+)
+FILTER_COLUMNS = ('category_slug', 'product_type_slug')
+MAX_QUERY_LENGTH = 200
+MAX_QUERY_TERMS = 8
+FUZZY_MAX_TERM_LENGTH = 20
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_ALPHABET = string.ascii_lowercase + string.digits
+_local = threading.local()
+_build_lock = threading.Lock()
+
+
+class SearchIndex:
+    def __init__(self, path=None):
+        self.path = str(path or settings.SEARCH_INDEX_PATH)
+
+    @property
+    def connection(self):
+        connections = getattr(_local, 'connections', None)
+        if connections is None:
+            connections = _local.connections = {}
+        if self.path not in connections:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._create_schema(conn)
+            connections[self.path] = conn
+        return connections[self.path]
+
+    def _create_schema(self, conn):
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'products'").fetchone()
+        if exists:
+            return
+        columns = ', '.join([name for name, _ in COLUMNS] + [f'{name} UNINDEXED' for name in FILTER_COLUMNS])
+        conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS products USING fts5("
+            f"{columns}, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        conn.execute('CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY) WITHOUT ROWID')
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+        weights = ', '.join(str(weight) for _, weight in COLUMNS)
+        conn.execute(f"INSERT INTO products(products, rank) VALUES ('rank', 'bm25({weights})')")
+
+    # -- writes --------------------------------------------------------------
+
+    def index_products(self, products):
+        rows = [(product.pk,) + _document(product) for product in products]
+        if not rows:
+            return
+        placeholders = ', '.join('?' * len(rows[0]))
+        conn = self.connection
+        with _transaction(conn):
+            conn.executemany('DELETE FROM products WHERE rowid = ?', [(row[0],) for row in rows])
+            conn.executemany(f'INSERT INTO products(rowid, {_column_list()}) VALUES ({placeholders})', rows)
+            terms = {term for row in rows for text in row[1:len(COLUMNS) + 1] for term in tokenize(text)}
+            conn.executemany('INSERT OR IGNORE INTO terms VALUES (?)', [(term,) for term in terms])
+
+    def remove_products(self, product_ids):
+        conn = self.connection
+        with _transaction(conn):
+            conn.executemany('DELETE FROM products WHERE rowid = ?', [(pk,) for pk in product_ids])
+
+    def rebuild(self, batch_size=2000):
+        conn = self.connection
+        with _transaction(conn):
+            conn.execute('DELETE FROM products')
+            conn.execute('DELETE FROM terms')
+        queryset = Product.objects.select_related('brand', 'category', 'product_type').order_by('pk')
+        batch = []
+        count = 0
+        for product in queryset.iterator(chunk_size=batch_size):
+            batch.append(product)
+            if len(batch) >= batch_size:
+                self.index_products(batch)
+                count += len(batch)
+                batch = []
+        self.index_products(batch)
+        count += len(batch)
+        with _transaction(conn):
+            conn.execute("INSERT INTO products(products) VALUES ('optimize')")
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('built', 1)")
+        return count
+
+    def ensure_built(self):
+        if self._meta('built'):
+            return
+        with _build_lock:
+            if not self._meta('built'):
+                self.rebuild()
+
+    # -- reads ---------------------------------------------------------------
+
+    def search(self, query, category=None, product_type=None, limit=20, offset=0):
+        """Return ranked product ids for ``query``, best match first."""
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        filters = ''
+        filter_params = []
+        if category:
+            filters += ' AND category_slug = ?'
+            filter_params.append(category)
+        if product_type:
+            filters += ' AND product_type_slug = ?'
+            filter_params.append(product_type)
+
+        sql = f'SELECT rowid FROM products WHERE products MATCH ?{filters} ORDER BY rank LIMIT ? OFFSET ?'
+        params = [expression] + filter_params + [limit, offset]
+        return [row[0] for row in self.connection.execute(sql, params)]
+
+    def match_expression(self, query):
+        """
+        Build an FTS5 query: every term must match, where an unknown term may
+        also match as a prefix (when it is the last one, still being typed) or
+        as any indexed word one edit away.
+        """
+        tokens = list(dict.fromkeys(tokenize((query or '')[:MAX_QUERY_LENGTH])))[:MAX_QUERY_TERMS]
+        if not tokens:
+            return ''
+        groups = []
+        for i, token in enumerate(tokens):
+            options = [_quote(token)]
+            if not self._known(token):
+                if i == len(tokens) - 1 and len(token) >= 2:
+                    options.append(_quote(token) + '*')
+                if 4 <= len(token) <= FUZZY_MAX_TERM_LENGTH:
+                    options.extend(_quote(word) for word in self._known_among(_edits1(token)))
+            groups.append('(' + ' OR '.join(options) + ')')
+        return ' AND '.join(groups)
+
+    def _known(self, term):
+        return self.connection.execute('SELECT 1 FROM terms WHERE term = ?', (term,)).fetchone() is not None
+
+    def _known_among(self, candidates):
+        candidates = sorted(candidates)
+        placeholders = ', '.join('?' * len(candidates))
+        rows = self.connection.execute(f'SELECT term FROM terms WHERE term IN ({placeholders})', candidates)
+        return [row[0] for row in rows]
+
+    def _meta(self, key):
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+
+_index = None
+
+
+def get_index():
+    global _index
+    if _index is None or _index.path != str(settings.SEARCH_INDEX_PATH):
+        _index = SearchIndex()
+    return _index
+
+
+def tokenize(text):
+    """Split text the way the index's unicode61 tokenizer does."""
+    text = unicodedata.normalize('NFKD', (text or '').lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _TOKEN_RE.findall(text)
+
+
+def _document(product):
+    fabric = ' '.join([product.kurta_fabric, product.bottom_fabric, product.dupatta_fabric, product.fabric_type])
+    return (
+        product.name,
+        product.brand.name if product.brand_id else '',
+        product.category.name if product.category_id else '',
+        product.product_type.name if product.product_type_id else '',
+        fabric,
+        product.work_type,
+        product.occasion,
+        product.description,
+        product.category.slug if product.category_id else None,
+        product.product_type.slug if product.product_type_id else None,
+    )
+
+
+def _column_list():
+    return ', '.join([name for name, _ in COLUMNS] + list(FILTER_COLUMNS))
+
+
+def _quote(token):
+    return '"' + token.replace('"', '""') + '"'
+
+
+def _edits1(word):
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    deletes = {a + b[1:] for a, b in splits if b}
+    transposes = {a + b[1] + b[0] + b[2:] for a, b in splits if len(b) > 1}
+    replaces = {a + c + b[1:] for a, b in splits if b for c in _ALPHABET}
+    inserts = {a + c + b for a, b in splits for c in _ALPHABET}
+    return deletes | transposes | replaces | inserts
+
+
+class _transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
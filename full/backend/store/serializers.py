@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Brand, Product, ProductImage, Category, Review, ProductType, Color
+from .ratings import STATS_FIELDS, rating_summary
 
 
 class BrandSerializer(serializers.ModelSerializer):
@@ -10,12 +11,24 @@ class BrandSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'slug', 'logo']
 
 
+class SparseFieldsMixin:
+    """Accepts a ``fields`` kwarg that restricts the serialized fields."""
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
 class ProductImageSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
 
     class Meta:
         model = ProductImage
         fields = ['id', 'image']
+        requires = {'image': ['image']}
 
     def get_image(self, obj):
         request = self.context.get("request")
@@ -30,6 +43,7 @@ class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug', 'image']
+        requires = {'image': ['image']}
 
     def get_image(self, obj):
         request = self.context.get("request")
@@ -50,7 +64,38 @@ class ColorSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'hex_code']
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductCardSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Compact product representation for listing grids."""
+    discounted_price = serializers.SerializerMethodField()
+    image = serializers.SerializerMethodField()
+    rating = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Product
+        fields = ["id", "name", "slug", "price", "discount_percentage", "discounted_price", "image", "stock", "rating"]
+        requires = {
+            "discounted_price": ["price", "discount_percentage"],
+            "image": ["images"],
+            "rating": ["rating_count", "rating_sum"],
+        }
+
+    def get_discounted_price(self, obj):
+        if obj.discount_percentage > 0:
+            return round(obj.price * (100 - obj.discount_percentage) / 100, 2)
+        return obj.price
+
+    def get_image(self, obj):
+        request = self.context.get("request")
+        image = _first_image(obj)
+        if image and image.image:
+            return request.build_absolute_uri(image.image.url) if request else image.image.url
+        return None
+
+    def get_rating(self, obj):
+        return rating_summary(obj)
+
+
+class ProductSerializer(ProductCardSerializer):
     brand = BrandSerializer(read_only=True)
     category = CategorySerializer(read_only=True)
     product_type = ProductTypeSerializer(read_only=True)
@@ -58,11 +103,7 @@ class ProductSerializer(serializers.ModelSerializer):
     available_colors = ColorSerializer(many=True, read_only=True)
     primary_color = ColorSerializer(read_only=True)
 
-    discounted_price = serializers.SerializerMethodField()
-    image = serializers.SerializerMethodField()
-
-    class Meta:
-        model = Product
+    class Meta(ProductCardSerializer.Meta):
         fields = [
             "id", "name", "slug", "description", "price", "discount_percentage", "discounted_price", "image",
             "stock", "brand", "category", "product_type",
@@ -71,26 +112,47 @@ class ProductSerializer(serializers.ModelSerializer):
             "fabric_type", "work_type", "occasion", "care_instructions",
             "primary_color", "available_colors",
             "sales_count", "is_best_seller", "is_trending", "is_featured",
-            "created_at", "images"
+            "created_at", "images", "rating"
         ]
+        requires = {**ProductCardSerializer.Meta.requires, "rating": STATS_FIELDS}
 
-    def get_discounted_price(self, obj):
-        if obj.discount_percentage > 0:
-            return round(obj.price * (100 - obj.discount_percentage) / 100, 2)
-        return obj.price
+    def get_rating(self, obj):
+        return rating_summary(obj, histogram=True)
 
-    def get_image(self, obj):
-        request = self.context.get("request")
-        image = obj.images.first()
-        if image and image.image:
-            return request.build_absolute_uri(image.image.url) if request else image.image.url
-        return None
+
+PRODUCT_VIEWS = {
+    "card": ProductCardSerializer,
+    "detail": ProductSerializer,
+}
+
+
+def get_product_representation(request, default="detail"):
+    """
+    Resolve ``?view=card|detail`` and ``?fields=a,b`` into a serializer class
+    and the ``fields`` kwarg to build it with.
+    """
+    serializer_class = PRODUCT_VIEWS.get(request.query_params.get("view"), PRODUCT_VIEWS[default])
+    requested = request.query_params.get("fields")
+    fields = None
+    if requested:
+        allowed = serializer_class.Meta.fields
+        fields = [name.strip() for name in requested.split(",") if name.strip() in allowed] or None
+    return serializer_class, fields
+
+
+def _first_image(product):
+    # .first() re-queries even when images were prefetched; read the cache instead.
+    if "images" in getattr(product, "_prefetched_objects_cache", {}):
+        images = product.images.all()
+        return images[0] if images else None
+    return product.images.first()
 
 
 class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
         fields = ['id', 'customer_name', 'rating', 'comment', 'created_at']
+        extra_kwargs = {'rating': {'min_value': 1, 'max_value': 5}}
 
 
 class ProductReviewSerializer(ReviewSerializer):
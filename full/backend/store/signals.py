@@ -0,0 +1,118 @@
+import logging
+import sqlite3
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils.timezone import now
+
+from .cache import bump_catalog_version, touch_model
+from .models import Brand, Category, Color, Product, ProductImage, ProductType, Review
+from .ratings import apply_rating
+from .search import get_index
+from .suggest import get_suggest_index
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=Color)
+@receiver(post_delete, sender=Color)
+@receiver(post_save, sender=ProductType)
+@receiver(post_delete, sender=ProductType)
+def invalidate_catalog_cache(sender, **kwargs):
+    touch_model(sender)
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_product_images(sender, instance, **kwargs):
+    # Images are part of the product's representation, so they move its row stamp.
+    Product.objects.filter(pk=instance.product_id).update(updated_at=now())
+    touch_model(Product)
+    bump_catalog_version()
+
+
+@receiver(m2m_changed, sender=Product.available_colors.through)
+def invalidate_product_colors(sender, instance, action, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, Product):
+        Product.objects.filter(pk=instance.pk).update(updated_at=now())
+    else:
+        Product.objects.filter(pk__in=pk_set or ()).update(updated_at=now())
+    touch_model(Product)
+    bump_catalog_version()
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    instance._previous_rating = None
+    if not instance._state.adding:
+        instance._previous_rating = sender.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def add_review_rating(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_rating', None)
+    if previous == (instance.product_id, instance.rating):
+        return
+    if previous:
+        apply_rating(*previous, sign=-1)
+    apply_rating(instance.product_id, instance.rating, sign=1)
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_rating(sender, instance, **kwargs):
+    apply_rating(instance.product_id, instance.rating, sign=-1)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    _update_search_index(lambda index: index.index_products([instance]))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    _update_search_index(lambda index: index.remove_products([instance.pk]))
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=ProductType)
+def reindex_related_products(sender, instance, created, **kwargs):
+    if created:
+        return
+    products = instance.products.select_related('brand', 'category', 'product_type')
+    _update_search_index(lambda index: index.index_products(products))
+
+
+@receiver(post_save, sender=Product)
+def suggest_product(sender, instance, **kwargs):
+    get_suggest_index().update('product', instance.pk, instance.name, instance.slug, instance.sales_count)
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Category)
+def suggest_group(sender, instance, **kwargs):
+    get_suggest_index().update(sender._meta.model_name, instance.pk, instance.name, instance.slug)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=Category)
+def unsuggest(sender, instance, **kwargs):
+    get_suggest_index().remove(sender._meta.model_name, instance.pk)
+
+
+def _update_search_index(update):
+    # The index can always be rebuilt, so a failure here must not fail the save.
+    try:
+        update(get_index())
+    except sqlite3.Error:
+        logger.exception("Search index update failed")
@@ -0,0 +1,279 @@
+"""
+In-process typeahead index for product names, brands and categories.
+
+Each kind keeps a sorted array with one key per word start of every name
+("red silk saree", "silk saree", "saree"), so a prefix is a ``bisect``
+range. Ranges short enough to rank on the fly are scanned; longer ones
+(one- or two-letter prefixes, common words) are answered from a per-prefix
+cache of the top matches, which is warmed for short prefixes at build time
+and kept current as items change: an added item is merged into the lists
+of its prefixes, and only lists holding a removed item are dropped.
+Products rank by ``sales_count``, brands and categories by the sales of
+their products.
+
+The index is built on first use (``backend/wsgi.py`` warms it at startup),
+kept current from ``store.signals`` and rebuilt in the background every
+``SUGGEST_INDEX_TTL`` seconds to pick up writes from other processes. At
+most ``SUGGEST_INDEX_MAX_PRODUCTS`` products are indexed, the best sellers,
+and a product saved into a full index displaces the lowest ranked one,
+found through a heap of (score, id) rather than a scan. ``stats()`` reports
+the size and the p99 of the last ``LATENCY_SAMPLES`` lookups; the target
+is under 5 ms.
+"""
+import heapq
+import logging
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+from .models import Brand, Category, Product
+from .search import tokenize
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('product', 'brand', 'category')
+LIMITS = {'product': 8, 'brand': 4, 'category': 4}
+SCAN_LIMIT = 256
+WARM_PREFIX_LENGTH = 2
+MAX_CACHED_PREFIXES = 20000
+LATENCY_SAMPLES = 1000
+
+
+class _PrefixArray:
+    def __init__(self, limit, max_items=None):
+        self.limit = limit
+        self.max_items = max_items
+        self.keys = []
+        self.refs = []
+        self.items = {}
+        self.top = {}
+        # Min-heap of (score, -id) for eviction; entries of removed or rescored items are skipped lazily.
+        self.ranked = []
+
+    def load(self, items):
+        self.items = {pk: (score, label, slug) for pk, label, slug, score in items}
+        entries = sorted((key, pk) for pk, (_, label, _) in self.items.items() for key in _keys(label))
+        self.keys = [key for key, _ in entries]
+        self.refs = [pk for _, pk in entries]
+        if self.max_items is not None:
+            self.ranked = [(score, -pk) for pk, (score, _, _) in self.items.items()]
+            heapq.heapify(self.ranked)
+        for key in self.keys:
+            for length in range(1, min(len(key), WARM_PREFIX_LENGTH) + 1):
+                prefix = key[:length]
+                if prefix not in self.top:
+                    self.top[prefix] = self._rank(*self._range(prefix))
+
+    def lookup(self, prefix):
+        cached = self.top.get(prefix)
+        if cached is None:
+            lo, hi = self._range(prefix)
+            if hi - lo <= SCAN_LIMIT:
+                return self._rank(lo, hi)
+            if len(self.top) >= MAX_CACHED_PREFIXES:
+                self.top.clear()
+            cached = self.top[prefix] = self._rank(lo, hi)
+        return cached
+
+    def put(self, pk, label, slug, score):
+        if self.max_items is not None and pk not in self.items and len(self.items) >= self.max_items:
+            # Full: like a rebuild, keep only the best ranked items.
+            lowest = self._lowest()
+            if (score, -pk) <= (self.items[lowest][0], -lowest):
+                return
+            self.remove(lowest)
+        self.remove(pk)
+        self.items[pk] = (score, label, slug)
+        if self.max_items is not None:
+            self._push(pk, score)
+        for key in _keys(label):
+            i = bisect_left(self.keys, key)
+            self.keys.insert(i, key)
+            self.refs.insert(i, pk)
+            self._offer(key, pk)
+
+    def remove(self, pk):
+        old = self.items.pop(pk, None)
+        if old is None:
+            return
+        for key in _keys(old[1]):
+            i = bisect_left(self.keys, key)
+            while i < len(self.keys) and self.keys[i] == key:
+                if self.refs[i] == pk:
+                    del self.keys[i]
+                    del self.refs[i]
+                    break
+                i += 1
+            self._invalidate(key, pk)
+
+    def nbytes(self):
+        strings = sum(sys.getsizeof(key) for key in self.keys)
+        labels = sum(sys.getsizeof(label) + sys.getsizeof(slug or '') for _, label, slug in self.items.values())
+        containers = sys.getsizeof(self.keys) + sys.getsizeof(self.refs) + sys.getsizeof(self.items)
+        cached = sys.getsizeof(self.top) + sum(sys.getsizeof(ids) for ids in self.top.values())
+        # Plus rough per-entry costs: a list slot per ref, a dict entry and tuple per item.
+        return strings + labels + containers + cached + 28 * len(self.refs) + 100 * len(self.items)
+
+    def _range(self, prefix):
+        return bisect_left(self.keys, prefix), bisect_left(self.keys, prefix + '\uffff')
+
+    def _rank(self, lo, hi):
+        # A name can match on several of its words; count it once.
+        ids = set(self.refs[lo:hi])
+        return heapq.nlargest(self.limit, ids, key=lambda pk: (self.items[pk][0], -pk))
+
+    def _lowest(self):
+        while True:
+            score, neg_pk = self.ranked[0]
+            item = self.items.get(-neg_pk)
+            if item is not None and item[0] == score:
+                return -neg_pk
+            heapq.heappop(self.ranked)
+
+    def _push(self, pk, score):
+        heapq.heappush(self.ranked, (score, -pk))
+        if len(self.ranked) > 2 * len(self.items) + 64:
+            self.ranked = [(score, -pk) for pk, (score, _, _) in self.items.items()]
+            heapq.heapify(self.ranked)
+
+    def _offer(self, key, pk):
+        # An added item can only join the cached lists of its own prefixes, so merge it in there.
+        rank = (self.items[pk][0], -pk)
+        for length in range(1, len(key) + 1):
+            prefix = key[:length]
+            cached = self.top.get(prefix)
+            if cached is None or pk in cached:
+                continue
+            if len(cached) < self.limit or rank > (self.items[cached[-1]][0], -cached[-1]):
+                merged = sorted(cached + [pk], key=lambda other: (self.items[other][0], -other), reverse=True)
+                self.top[prefix] = merged[:self.limit]
+
+    def _invalidate(self, key, pk):
+        # Only lists the item was in change when it goes; those are recomputed on the next lookup.
+        for length in range(1, len(key) + 1):
+            cached = self.top.get(key[:length])
+            if cached is not None and pk in cached:
+                del self.top[key[:length]]
+
+
+class SuggestIndex:
+    def __init__(self):
+        self.arrays = None
+        self.built_at = None
+        self._lock = threading.RLock()
+        self._rebuilding = False
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def build(self):
+        started = time.monotonic()
+        max_products = getattr(settings, 'SUGGEST_INDEX_MAX_PRODUCTS', 200000)
+        arrays = {kind: _PrefixArray(LIMITS[kind], max_products if kind == 'product' else None) for kind in KINDS}
+        products = Product.objects.order_by('-sales_count', '-id').values_list('pk', 'name', 'slug', 'sales_count')
+        arrays['product'].load(products[:max_products])
+        for kind, model in (('brand', Brand), ('category', Category)):
+            rows = model.objects.annotate(score=Coalesce(Sum('products__sales_count'), 0))
+            arrays[kind].load(rows.values_list('pk', 'name', 'slug', 'score'))
+        with self._lock:
+            self.arrays = arrays
+            self.built_at = time.monotonic()
+        stats = self.stats()
+        logger.info(
+            "Suggest index built in %.2fs: %d keys, %.1f MiB",
+            time.monotonic() - started, stats['keys'], stats['bytes'] / 2 ** 20,
+        )
+
+    def warm(self):
+        """Build in a background thread, e.g. at process start."""
+        self._rebuild_in_background()
+
+    def suggest(self, query):
+        self._ensure_fresh()
+        prefix = ' '.join(tokenize(query))
+        if not prefix:
+            return {kind: [] for kind in KINDS}
+        with self._lock:
+            started = time.perf_counter()
+            results = {}
+            for kind, array in self.arrays.items():
+                results[kind] = [
+                    {'id': pk, 'name': array.items[pk][1], 'slug': array.items[pk][2]}
+                    for pk in array.lookup(prefix)
+                ]
+            self._latencies.append(time.perf_counter() - started)
+            return results
+
+    def update(self, kind, pk, label, slug, score=None):
+        with self._lock:
+            if self.arrays is None:
+                return
+            array = self.arrays[kind]
+            if score is None:
+                score = array.items.get(pk, (0,))[0]
+            array.put(pk, label, slug, score)
+
+    def remove(self, kind, pk):
+        with self._lock:
+            if self.arrays is not None:
+                self.arrays[kind].remove(pk)
+
+    def stats(self):
+        with self._lock:
+            if self.arrays is None:
+                return {'built': False, 'keys': 0, 'items': {}, 'cached_prefixes': 0, 'bytes': 0, 'p99_ms': 0.0}
+            return {
+                'built': True,
+                'age_seconds': round(time.monotonic() - self.built_at, 1),
+                'keys': sum(len(array.keys) for array in self.arrays.values()),
+                'items': {kind: len(array.items) for kind, array in self.arrays.items()},
+                'cached_prefixes': sum(len(array.top) for array in self.arrays.values()),
+                'bytes': sum(array.nbytes() for array in self.arrays.values()),
+                'p99_ms': round(_percentile(self._latencies, 0.99) * 1000, 3),
+            }
+
+    def _ensure_fresh(self):
+        if self.arrays is None:
+            with self._lock:
+                if self.arrays is None:
+                    self.build()
+        elif time.monotonic() - self.built_at > getattr(settings, 'SUGGEST_INDEX_TTL', 300):
+            self._rebuild_in_background()
+
+    def _rebuild_in_background(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild, daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception("Suggest index rebuild failed")
+        finally:
+            self._rebuilding = False
+            connections.close_all()
+
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[int(fraction * (len(ordered) - 1))] if ordered else 0.0
+
+
+def _keys(label):
+    tokens = tokenize(label)
+    return {' '.join(tokens[i:]) for i in range(len(tokens))}
+
+
+_index = SuggestIndex()
+
+
+def get_suggest_index():
+    return _index
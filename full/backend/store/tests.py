@@ -1,3 +1,904 @@
-from django.test import TestCase
+import io
+import json
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, OperationalError, connection
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ParseError
+from rest_framework.permissions import AllowAny
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from backend.renderers import ORJSONParser, ORJSONRenderer
+from cart.models import Order, OrderItem, WishlistItem
+
+from .cache import _response_key, bump_catalog_version, catalog_cache, get_cache, get_catalog_version, touch_model
+from .counters import CounterBuffer, _flush_at_exit, get_counters
+from .idempotency import idempotent
+from .jobs import claim_jobs, enqueue, run_job, task
+from .models import Brand, Category, Color, Job, Product, ProductImage, ProductType, RelatedProduct, Review
+from .pagination import ProductCursorPagination, keyset_after
+from .ratings import rating_summary, rebuild_rating_stats
+from .recommendations import build_related_products
+from .search import MAX_QUERY_LENGTH, MAX_QUERY_TERMS, get_index
+from .serializers import ProductCardSerializer
+from .streaming import stream_serialized
+from .suggest import SuggestIndex, _percentile, _PrefixArray
+from .views import BATCH_MAX_PRODUCTS
+
+
+class ProductIndexTests(TestCase):
+    """Every product listing shape should be answered from an index, with no sort step."""
+
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name="Brand")
+        category = Category.objects.create(name="Suits")
+        product_type = ProductType.objects.create(name="Unstitched")
+        start = now()
+        Product.objects.bulk_create([
+            Product(
+                name=f"Product {i}", slug=f"product-{i}", description="", brand=brand,
+                category=category if i % 2 else None, product_type=product_type if i % 3 else None,
+                price=Decimal(100 + i % 7), discounted_price=Decimal(100 + i % 7),
+                discount_percentage=i % 5 * 10, sales_count=i % 11,
+                is_featured=i % 50 == 0, is_trending=i % 60 == 0,
+                created_at=start - timedelta(minutes=i),
+            )
+            for i in range(300)
+        ])
+        # Give the planner real selectivity numbers, as a live database has.
+        with connection.cursor() as cursor:
+            table = Product._meta.db_table
+            cursor.execute(f"ANALYZE {table}" if connection.vendor == "sqlite" else f"ANALYZE TABLE {table}")
+        cls.category = category
+        cls.product_type = product_type
+
+    def assertIndexedOrder(self, queryset, *index_names):
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names), plan)
+        if connection.vendor == "sqlite":
+            self.assertNotIn("TEMP B-TREE", plan)
+        elif connection.vendor == "mysql":
+            self.assertNotIn("Using filesort", plan)
+
+    def test_sort_orders_use_their_index(self):
+        expected = {
+            "newest": "product_newest_idx",
+            "price_asc": "product_price_idx",
+            "price_desc": "product_price_idx",
+            "discount": "product_discount_idx",
+            "popularity": "product_popularity_idx",
+        }
+        for key, index_name in expected.items():
+            with self.subTest(ordering=key):
+                ordering = ProductCursorPagination.orderings[key]
+                self.assertIndexedOrder(Product.objects.order_by(*ordering)[:25], index_name)
+
+    def test_keyset_page_uses_index(self):
+        ordering = ProductCursorPagination.orderings["newest"]
+        last = Product.objects.order_by(*ordering)[100]
+        queryset = Product.objects.order_by(*ordering).filter(keyset_after(ordering, [last.created_at, last.id]))
+        self.assertIndexedOrder(queryset[:25], "product_newest_idx")
+
+    def test_filtered_listings_use_composite_index(self):
+        newest = ProductCursorPagination.orderings["newest"]
+        # On SQLite Django renders `is_featured=True` as a bare `WHERE is_featured`,
+        # which can't seek an index, so there it walks the newest index instead.
+        # MySQL compares with `= 1` and seeks the composite index.
+        flag_fallback = ("product_newest_idx",) if connection.vendor == "sqlite" else ()
+        cases = [
+            (Product.objects.filter(is_featured=True), ("product_featured_newest_idx",) + flag_fallback),
+            (Product.objects.filter(is_trending=True), ("product_trending_newest_idx",) + flag_fallback),
+            (Product.objects.filter(category=self.category), ("product_category_newest_idx",)),
+            (Product.objects.filter(product_type=self.product_type), ("product_type_newest_idx",)),
+        ]
+        for queryset, index_names in cases:
+            with self.subTest(index=index_names[0]):
+                self.assertIndexedOrder(queryset.order_by(*newest)[:25], *index_names)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name="Brand")
+        cls.in_name = Product.objects.create(name="Velvet Shawl", description="Warm", price=100, brand=brand)
+        cls.in_description = Product.objects.create(
+            name="Winter Suit", description="Trimmed with velvet", price=100, brand=brand,
+        )
+        Product.objects.create(name="Lawn Suit", description="Printed", price=100, brand=brand)
+
+    def setUp(self):
+        self.index = get_index()
+        self.index.rebuild()
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.index.search("velvet"), [self.in_name.pk, self.in_description.pk])
+
+    def test_one_edit_typo_still_matches(self):
+        self.assertEqual(self.index.search("velvat shawl"), [self.in_name.pk])
+
+    def test_older_matches_are_still_ranked(self):
+        brand = Brand.objects.get()
+        Product.objects.bulk_create([
+            Product(
+                name=f"Embroidered Velvet Suit {i}", slug=f"suit-{i}", description="Festive wear", price=100,
+                brand=brand,
+            )
+            for i in range(1100)
+        ])
+        self.index.rebuild()
+        self.assertEqual(self.index.search("velvet", limit=1), [self.in_name.pk])
+
+    def test_category_and_product_type_filters(self):
+        shawls = Category.objects.create(name="Shawls")
+        stitched = ProductType.objects.create(name="Stitched")
+        Product.objects.filter(pk=self.in_name.pk).update(category=shawls)
+        Product.objects.filter(pk=self.in_description.pk).update(product_type=stitched)
+        self.index.rebuild()
+
+        self.assertEqual(self.index.search("velvet", category="shawls"), [self.in_name.pk])
+        self.assertEqual(self.index.search("velvet", product_type="stitched"), [self.in_description.pk])
+        self.assertEqual(self.index.search("velvet", category="shawls", product_type="stitched"), [])
+
+        response = self.client.get("/api/search/", {"q": "velvet", "product_type": "stitched", "view": "card"})
+        self.assertEqual([product["id"] for product in response.json()["results"]], [self.in_description.pk])
+
+    def test_long_queries_are_capped(self):
+        expression = self.index.match_expression(" ".join(f"term{i}" for i in range(3000)))
+        self.assertEqual(expression.count(" AND "), MAX_QUERY_TERMS - 1)
+        with mock.patch("store.search._edits1") as edits1:
+            self.index.match_expression("x" * 16000)
+        edits1.assert_not_called()
+
+        response = self.client.get("/api/search/", {"q": "velvet " * 3000})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["query"]), MAX_QUERY_LENGTH)
+
+
+@override_settings(COUNTER_FLUSH_INTERVAL=0)
+class CounterBufferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name="Brand")
+        cls.first = Product.objects.create(name="First", description="-", price=100, brand=brand)
+        cls.second = Product.objects.create(name="Second", description="-", price=100, brand=brand)
+
+    def setUp(self):
+        self.buffer = CounterBuffer()
+
+    def counts(self, field):
+        return list(Product.objects.order_by("pk").values_list(field, flat=True))
+
+    def test_flush_writes_buffered_increments(self):
+        self.buffer.incr("view_count", self.first.pk)
+        self.buffer.incr("view_count", self.first.pk, 2)
+        self.buffer.incr("sales_count", self.second.pk, 4)
+        self.assertEqual(self.buffer.stats()["pending_products"], 2)
+
+        with self.assertNumQueries(3):  # savepoint, one UPDATE, release
+            self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self.counts("view_count"), [3, 0])
+        self.assertEqual(self.counts("sales_count"), [0, 4])
+        self.assertEqual(self.buffer.stats()["pending_products"], 0)
+        self.assertEqual(self.buffer.flush(), 0)
+
+    def test_sales_flush_invalidates_best_sellers(self):
+        Product.objects.filter(pk=self.first.pk).update(sales_count=11)
+        get_cache().clear()
+        url = "/api/products/best-sellers/"
+        etag = self.client.get(url)["ETag"]
+        version = get_catalog_version()
+
+        self.buffer.incr("view_count", self.first.pk, 5)
+        self.buffer.flush()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(get_catalog_version(), version)
+
+        before = Product.objects.get(pk=self.second.pk).updated_at
+        self.buffer.incr("sales_count", self.second.pk, 20)
+        self.buffer.flush()
+        self.assertGreater(Product.objects.get(pk=self.second.pk).updated_at, before)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product["id"] for product in response.json()], [self.second.pk, self.first.pk])
+
+    def test_failed_flush_is_requeued_and_written_once(self):
+        self.buffer.incr("view_count", self.first.pk)
+        self.buffer.incr("view_count", self.second.pk)
+        update = QuerySet.update
+        calls = []
+
+        def fail_second_chunk(queryset, **kwargs):
+            calls.append(kwargs)
+            if len(calls) == 2:
+                raise DatabaseError("connection lost")
+            return update(queryset, **kwargs)
+
+        with mock.patch("store.counters.FLUSH_CHUNK_SIZE", 1), \
+                mock.patch.object(QuerySet, "update", autospec=True, side_effect=fail_second_chunk):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+        self.assertEqual(self.counts("view_count"), [0, 0])
+        self.assertEqual(self.buffer.stats()["failures"], 1)
+
+        self.buffer.flush()
+        self.assertEqual(self.counts("view_count"), [1, 1])
+
+    def test_buffer_is_flushed_at_exit(self):
+        self.buffer.incr("wishlist_count", self.first.pk)
+        with mock.patch("store.counters._buffer", self.buffer):
+            _flush_at_exit()
+        self.assertEqual(self.counts("wishlist_count"), [1, 0])
+
+    def test_exit_flush_without_a_database_drops_quietly(self):
+        self.buffer.incr("view_count", self.first.pk)
+        with mock.patch("store.counters._buffer", self.buffer), \
+                mock.patch("store.counters._write", side_effect=OperationalError("no such table: store_product")), \
+                self.assertLogs("store.counters", "WARNING") as logs:
+            _flush_at_exit()
+        self.assertIn("Dropped 1 buffered counter increments", logs.output[0])
+        self.assertEqual(self.buffer.stats()["pending_products"], 0)
+
+
+class RelatedProductsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name="Brand")
+        cls.product = Product.objects.create(name="Suit", slug="suit", description="-", price=100, brand=brand)
+
+    def test_rebuild_invalidates_conditional_responses(self):
+        url = f"/api/products/{self.product.slug}/related/"
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        build_related_products()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_neighbours_are_ranked_by_cosine_and_cut_at_top_k(self):
+        # Another brand, so the endpoint's same-brand top-up adds nothing.
+        brand = Brand.objects.create(name="Other")
+        b, c, d, e = (
+            Product.objects.create(name=name, slug=name.lower(), description="-", price=100, brand=brand)
+            for name in ("B", "C", "D", "E")
+        )
+        users = [get_user_model().objects.create_user(username=f"user{i}") for i in range(4)]
+        for user, products in zip(users, [(self.product, b, c), (self.product, b), (self.product, b), (c, e)]):
+            WishlistItem.objects.bulk_create(WishlistItem(user=user, product=product) for product in products)
+        # D comes in through an order snapshot, which is weighted 1 against a wishlist entry's 0.5.
+        order = Order.objects.create(user=users[2], total_cost=100)
+        OrderItem.objects.create(order=order, product_name="D", product_price=100, quantity=1, product_data={"id": d.pk})
+
+        build_related_products(top_k=2)
+        # Columns A = B = (.5, .5, .5, 0), C = (.5, 0, 0, .5), D = (0, 0, 1, 0).
+        neighbours = RelatedProduct.objects.filter(product=self.product).order_by("rank")
+        self.assertEqual([row.related_id for row in neighbours], [b.pk, d.pk])
+        self.assertAlmostEqual(neighbours[0].score, 1.0)
+        self.assertAlmostEqual(neighbours[1].score, 3 ** -0.5)
+
+        response = self.client.get(f"/api/products/{self.product.slug}/related/", {"view": "card"})
+        self.assertEqual([product["id"] for product in response.json()], [b.pk, d.pk])
+
+
+@override_settings(COUNTER_FLUSH_INTERVAL=0)
+class ConditionalCatalogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name="Brand")
+        Product.objects.create(name="Suit", slug="suit", description="-", price=100, brand=brand)
+
+    def setUp(self):
+        self.addCleanup(get_counters().clear)
+
+    def test_product_type_changes_move_list_and_detail_validators(self):
+        for url in ("/api/products/featured/", "/api/products/suit/"):
+            with self.subTest(url=url):
+                etag = self.client.get(url)["ETag"]
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+                touch_model(ProductType)
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.calls = 0
+
+        @catalog_cache(timeout=60)
+        def view(request):
+            self.calls += 1
+            return Response({"call": self.calls})
+
+        self.view = view
+        self.request = Request(APIRequestFactory().get("/catalog/", {"page_size": 10}))
+
+    def lock_key(self):
+        return _response_key(self.view, self.request, (), {}) + ":lock"
+
+    def test_response_is_cached_until_the_catalog_changes(self):
+        self.assertEqual(self.view(self.request).data, {"call": 1})
+        self.assertEqual(self.view(self.request).data, {"call": 1})
+
+        ProductType.objects.create(name="Stitched")
+        self.assertEqual(self.view(self.request).data, {"call": 2})
+        self.assertIsNone(get_cache().get(self.lock_key()))
+
+    def test_stale_entry_is_served_while_another_worker_recomputes(self):
+        self.view(self.request)
+        bump_catalog_version()
+        get_cache().add(self.lock_key(), 1)
+        self.assertEqual(self.view(self.request).data, {"call": 1})
+        self.assertEqual(self.calls, 1)
+
+        get_cache().delete(self.lock_key())
+        self.assertEqual(self.view(self.request).data, {"call": 2})
+
+    def test_cold_miss_under_lock_computes_without_caching(self):
+        get_cache().add(self.lock_key(), 1)
+        self.assertEqual(self.view(self.request).data, {"call": 1})
+        self.assertEqual(self.view(self.request).data, {"call": 2})
+
+
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.factory = APIRequestFactory()
+        self.user = get_user_model().objects.create_user(username="shopper")
+
+        @api_view(["POST"])
+        @permission_classes([AllowAny])
+        @idempotent(wait_timeout=0.1)
+        def view(request):
+            self.calls.append(request.data)
+            if self.on_call:
+                return self.on_call(request)
+            return Response({"call": len(self.calls)}, status=201)
+
+        self.view = view
+        self.on_call = None
+
+    def post(self, body, key="key-1", user=None, **extra):
+        request = self.factory.post("/orders/", body, format="json", HTTP_IDEMPOTENCY_KEY=key, **extra)
+        if user is not None:
+            force_authenticate(request, user)
+        return self.view(request)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.post({"quantity": 1}, user=self.user)
+        retry = self.post({"quantity": 1}, user=self.user)
+        self.assertEqual((first.status_code, first.data), (201, {"call": 1}))
+        self.assertEqual((retry.status_code, retry.data), (201, {"call": 1}))
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(len(self.calls), 1)
+
+    def test_same_key_with_a_different_body_is_rejected(self):
+        self.post({"quantity": 1}, user=self.user)
+        self.assertEqual(self.post({"quantity": 2}, user=self.user).status_code, 422)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_duplicate_while_in_flight_gets_409(self):
+        duplicates = []
+
+        def run_duplicate(request):
+            duplicates.append(self.post({"quantity": 1}, user=self.user))
+            return Response({}, status=201)
+
+        self.on_call = run_duplicate
+        self.post({"quantity": 1}, user=self.user)
+        self.assertEqual(duplicates[0].status_code, 409)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_server_error_releases_the_key(self):
+        self.on_call = lambda request: Response({}, status=503)
+        self.assertEqual(self.post({"quantity": 1}, user=self.user).status_code, 503)
+        self.on_call = None
+        self.assertEqual(self.post({"quantity": 1}, user=self.user).status_code, 201)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_anonymous_clients_do_not_share_keys(self):
+        self.post({"email": "a@example.com"}, REMOTE_ADDR="10.0.0.1")
+        self.post({"email": "a@example.com"}, REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(len(self.calls), 2)
+        replay = self.post({"email": "a@example.com"}, REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(replay["Idempotent-Replayed"], "true")
+        self.assertEqual(len(self.calls), 2)
+
+
+@override_settings(COUNTER_FLUSH_INTERVAL=0)
+class EagerLoadingTests(TestCase):
+    """Product endpoints read a fixed number of queries however many products, images and colours they show."""
+
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name="Brand")
+        category = Category.objects.create(name="Suits")
+        colors = [Color.objects.create(name=name) for name in ("Red", "Blue")]
+        cls.products = []
+        for i in range(12):
+            product = Product.objects.create(
+                name=f"Product {i}", slug=f"product-{i}", description="-", price=100, brand=brand, category=category,
+            )
+            product.available_colors.set(colors)
+            ProductImage.objects.create(product=product, image=f"product_images/{i}.jpg")
+            ProductImage.objects.create(product=product, image=f"product_images/{i}-back.jpg")
+            cls.products.append(product)
+
+    def setUp(self):
+        get_cache().clear()
+        self.addCleanup(get_counters().clear)
+
+    def assertQueries(self, count, url):
+        with self.assertNumQueries(count):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_list(self):
+        self.assertQueries(3, "/api/products/")
+
+    def test_card_view(self):
+        self.assertQueries(2, "/api/products/?view=card")
+
+    def test_detail(self):
+        # The conditional check reads the row stamp before the view runs.
+        self.assertQueries(4, "/api/products/product-0/")
+
+    def test_batch(self):
+        ids = ",".join(str(product.pk) for product in self.products)
+        response = self.assertQueries(3, f"/api/products/batch/?ids={ids}")
+        self.assertEqual(len(response.json()["results"]), 12)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name="Brand")
+        start = now()
+        # Few distinct sort values, so pages split runs of ties and the id tiebreak matters.
+        Product.objects.bulk_create([
+            Product(
+                name=f"Product {i}", slug=f"product-{i}", description="", brand=brand,
+                price=Decimal(100 + i % 4), discounted_price=Decimal(100 + i % 4),
+                discount_percentage=i % 3 * 10, sales_count=i % 5,
+                created_at=start - timedelta(minutes=i // 3),
+            )
+            for i in range(130)
+        ])
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [product["id"] for product in response.json()["results"]]
+
+    def test_cursor_round_trip_for_every_ordering(self):
+        for key, ordering in ProductCursorPagination.orderings.items():
+            with self.subTest(ordering=key):
+                expected = list(Product.objects.order_by(*ordering).values_list("id", flat=True))
+                pages = []
+                response = self.client.get("/api/products/", {"ordering": key, "page_size": 40, "view": "card"})
+                pages.append(self.ids(response))
+                self.assertIsNone(response.json()["previous"])
+                while response.json()["next"]:
+                    response = self.client.get(response.json()["next"])
+                    pages.append(self.ids(response))
+                self.assertEqual([pk for page in pages for pk in page], expected)
+
+                for page in reversed(pages[:-1]):
+                    response = self.client.get(response.json()["previous"])
+                    self.assertEqual(self.ids(response), page)
+
+    def test_page_size_is_capped(self):
+        response = self.client.get("/api/products/", {"page_size": 500, "view": "card"})
+        self.assertEqual(len(self.ids(response)), 100)
+
+    def test_bad_cursor_is_not_found(self):
+        for cursor in ("not-a-cursor", "eyJvIjoibmV3ZXN0In0"):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get("/api/products/", {"cursor": cursor}).status_code, 404)
+
+    def test_plain_array_without_cursor_or_page_size(self):
+        response = self.client.get("/api/products/", {"view": "card"})
+        self.assertIsInstance(response.json(), list)
+        self.assertEqual(len(response.json()), 130)
+
+    @override_settings(UNPAGINATED_MAX_ROWS=50)
+    def test_plain_array_is_capped(self):
+        expected = list(Product.objects.order_by("-created_at", "-id").values_list("id", flat=True)[:50])
+        for url in ("/api/products/", "/api/filtered-products/"):
+            with self.subTest(url=url):
+                response = self.client.get(url, {"view": "card"})
+                self.assertEqual([product["id"] for product in response.json()], expected)
+
+
+class SuggestIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name="Brand")
+        for sales in (1, 2, 3):
+            Product.objects.create(
+                name=f"Silk {sales}", slug=f"silk-{sales}", description="-", price=100, brand=brand,
+                sales_count=sales,
+            )
+
+    def names(self, index):
+        return [item["name"] for item in index.suggest("silk")["product"]]
+
+    @override_settings(SUGGEST_INDEX_MAX_PRODUCTS=2)
+    def test_product_cap_holds_on_build_and_update(self):
+        index = SuggestIndex()
+        index.build()
+        self.assertEqual(self.names(index), ["Silk 3", "Silk 2"])
+
+        index.update("product", 100, "Silk 0", "silk-0", 0)
+        self.assertEqual(self.names(index), ["Silk 3", "Silk 2"])
+        index.update("product", 101, "Silk 5", "silk-5", 5)
+        self.assertEqual(self.names(index), ["Silk 5", "Silk 3"])
+        index.update("product", 101, "Silk Five", "silk-5", 5)
+        self.assertEqual(index.stats()["items"]["product"], 2)
+
+        # Rescored down, Silk 5 is now the one a newcomer displaces.
+        index.update("product", 101, "Silk Five", "silk-5", 0)
+        index.update("product", 102, "Silk 1", "silk-1", 1)
+        self.assertEqual(self.names(index), ["Silk 3", "Silk 1"])
+
+    def test_p99_stays_under_5ms_on_a_full_index(self):
+        words = ["silk", "cotton", "chiffon", "georgette", "velvet", "lawn", "red", "blue", "suit", "saree", "kurta"]
+        array = _PrefixArray(limit=8, max_items=50000)
+        array.load(
+            (pk, f"{words[pk % 11]} {words[pk // 11 % 11]} {words[pk // 121 % 11]} {pk}", f"p-{pk}", pk % 997)
+            for pk in range(50000)
+        )
+        # Steady state: each prefix has been asked for once since the build.
+        prefixes = [word[:length] for word in words for length in range(1, 5)]
+        for prefix in prefixes:
+            array.lookup(prefix)
+        timings = []
+        for i in range(2000):
+            started = time.perf_counter()
+            if i % 2:
+                array.lookup(prefixes[i % len(prefixes)])
+            else:
+                array.put(50000 + i, f"{words[i % 11]} new {i}", f"n-{i}", i % 1500)
+            timings.append(time.perf_counter() - started)
+        self.assertEqual(len(array.items), 50000)
+        self.assertLess(_percentile(timings, 0.99), 0.005)
+
+
+@override_settings(COUNTER_FLUSH_INTERVAL=0)
+class ProductRepresentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name="Brand")
+        product = Product.objects.create(
+            name="Suit", slug="suit", description="-", price=1000, discount_percentage=25, brand=brand,
+        )
+        ProductImage.objects.create(product=product, image="product_images/suit.jpg")
+
+    def setUp(self):
+        get_cache().clear()
+        self.addCleanup(get_counters().clear)
+
+    def test_card_view(self):
+        product = self.client.get("/api/products/", {"view": "card"}).json()[0]
+        self.assertEqual(set(product), set(ProductCardSerializer.Meta.fields))
+        self.assertEqual(Decimal(product["discounted_price"]), Decimal(750))
+        self.assertTrue(product["image"].endswith("product_images/suit.jpg"))
+
+    def test_sparse_fieldset_drops_unknown_fields_and_their_queries(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/products/", {"view": "card", "fields": "id,name,description"})
+        self.assertEqual(response.json(), [{"id": Product.objects.get().pk, "name": "Suit"}])
+
+    def test_detail_is_the_default(self):
+        product = self.client.get("/api/products/suit/", {"fields": "name,brand"}).json()
+        self.assertEqual(product, {"name": "Suit", "brand": {**product["brand"], "name": "Brand"}})
+
+
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.alpha = Brand.objects.create(name="Alpha")
+        cls.beta = Brand.objects.create(name="Beta")
+        red, blue = Color.objects.create(name="Red"), Color.objects.create(name="Blue")
+        rows = [
+            (cls.alpha, red, [red, blue], 100, 5, "lawn"),
+            (cls.alpha, blue, [], 200, 0, "silk"),
+            (cls.beta, red, [blue], 300, 2, "lawn"),
+        ]
+        for i, (brand, primary, available, price, stock, fabric) in enumerate(rows):
+            product = Product.objects.create(
+                name=f"Product {i}", slug=f"product-{i}", description="-", price=price, stock=stock,
+                brand=brand, primary_color=primary, fabric_type=fabric,
+            )
+            product.available_colors.set(available)
+
+    def get(self, **params):
+        response = self.client.get("/api/filtered-products/", {"facets": "true", "view": "card", **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_counts_without_filters(self):
+        facets = self.get()["facets"]
+        self.assertEqual([(b["name"], b["count"]) for b in facets["brand"]], [("Alpha", 2), ("Beta", 1)])
+        # Product 0 has red as both primary and available colour and counts once.
+        self.assertEqual([(c["name"], c["count"]) for c in facets["color"]], [("Blue", 3), ("Red", 2)])
+        self.assertEqual(facets["fabric_type"], [{"value": "lawn", "count": 2}, {"value": "silk", "count": 1}])
+        self.assertEqual(facets["in_stock"], {"in_stock": 2, "out_of_stock": 1})
+        self.assertEqual((Decimal(facets["price"]["min"]), Decimal(facets["price"]["max"])), (100, 300))
+
+    def test_each_dimension_ignores_its_own_filter(self):
+        data = self.get(brand=self.alpha.slug, fabric_type="lawn")
+        self.assertEqual([product["name"] for product in data["results"]], ["Product 0"])
+        facets = data["facets"]
+        self.assertEqual([(b["name"], b["count"]) for b in facets["brand"]], [("Alpha", 1), ("Beta", 1)])
+        self.assertEqual(facets["fabric_type"], [{"value": "lawn", "count": 1}, {"value": "silk", "count": 1}])
+        self.assertEqual(facets["in_stock"], {"in_stock": 1, "out_of_stock": 0})
+
+    def test_malformed_number_is_rejected(self):
+        response = self.client.get("/api/filtered-products/", {"price_min": "cheap"})
+        self.assertEqual(response.status_code, 400)
+
+
+class StreamingExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name="Brand")
+        start = now()
+        Product.objects.bulk_create([
+            Product(
+                name=f"Product {i}", slug=f"product-{i}", description="", brand=brand, price=100 + i % 3,
+                discounted_price=100 + i % 3, stock=i % 2, created_at=start - timedelta(minutes=i // 2),
+            )
+            for i in range(10)
+        ])
+        cls.admin = get_user_model().objects.create_user(username="admin", is_staff=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def body(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content)
+
+    def test_json_export_in_ordering(self):
+        response = self.client.get("/api/products/export/", {"view": "card", "ordering": "price_asc"})
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="products.json"')
+        ids = [product["id"] for product in json.loads(self.body(response))]
+        self.assertEqual(ids, list(Product.objects.order_by("price", "id").values_list("id", flat=True)))
+
+    def test_ndjson_export_with_filters(self):
+        response = self.client.get("/api/products/export/", {"stream": "ndjson", "view": "card", "in_stock": "true"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = self.body(response).splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(all(json.loads(line)["stock"] == 1 for line in lines))
+
+    def test_export_needs_staff(self):
+        self.client.force_authenticate(get_user_model().objects.create_user(username="shopper"))
+        self.assertEqual(self.client.get("/api/products/export/").status_code, 403)
+
+    def test_batches_are_keyset_queries(self):
+        serializer = ProductCardSerializer(fields=["id", "name"])
+        ordering = ProductCursorPagination.orderings["newest"]
+        with self.assertNumQueries(3):
+            chunks = list(stream_serialized(Product.objects.only("id", "name"), serializer, ordering, batch_size=4))
+        self.assertEqual(len(chunks), 3)
+        ids = [product["id"] for product in json.loads(b"".join(chunks))]
+        self.assertEqual(ids, list(Product.objects.order_by(*ordering).values_list("id", flat=True)))
+        self.assertEqual(b"".join(stream_serialized(Product.objects.none(), serializer, ordering)), b"[]")
+        products = json.loads(self.body(self.client.get("/api/products/", {"stream": "true", "view": "card"})))
+        self.assertEqual(len(products), 10)
+
+
+class ORJSONTests(TestCase):
+    def test_renders_like_the_stock_renderer(self):
+        data = {
+            "id": 1,
+            "price": Decimal("1499.50"),
+            "created_at": now(),
+            "day": now().date(),
+            "name": "Lawn\u2028Suit \u2029 é",
+            "tags": ["new", None, True, 2.5],
+            "nested": {3: "int keys", "big": 2 ** 70},
+        }
+        for payload in (data, [data], {}, "text"):
+            with self.subTest(payload=type(payload).__name__):
+                self.assertEqual(ORJSONRenderer().render(payload), JSONRenderer().render(payload))
+        self.assertEqual(ORJSONRenderer().render(None), b"")
+
+    def test_parses_and_rejects_like_the_stock_parser(self):
+        parsed = ORJSONParser().parse(io.BytesIO('{"q": "é", "n": [1, 2.5]}'.encode()))
+        self.assertEqual(parsed, {"q": "é", "n": [1, 2.5]})
+        for body in (b"{bad", b'{"n": NaN}'):
+            with self.subTest(body=body), self.assertRaises(ParseError):
+                ORJSONParser().parse(io.BytesIO(body))
+
+    def test_api_responses_use_it(self):
+        response = self.client.get("/api/products/batch/", {"ids": "1"})
+        self.assertIsInstance(response.accepted_renderer, ORJSONRenderer)
+
+
+class RatingStatsTests(TestCase):
+    def setUp(self):
+        brand = Brand.objects.create(name="Brand")
+        self.product = Product.objects.create(name="Suit", slug="suit", description="-", price=100, brand=brand)
+
+    def stats(self):
+        self.product.refresh_from_db()
+        return rating_summary(self.product, histogram=True)
+
+    def review(self, rating):
+        return Review.objects.create(product=self.product, customer_name="A", rating=rating, comment="-")
+
+    def test_saves_and_deletes_keep_stats_current(self):
+        self.review(5)
+        low = self.review(2)
+        self.assertEqual(self.stats(), {
+            "average": 3.5, "count": 2, "histogram": {"1": 0, "2": 1, "3": 0, "4": 0, "5": 1},
+        })
+        low.rating = 4
+        low.save()
+        self.assertEqual(self.stats()["average"], 4.5)
+        self.assertEqual(self.stats()["histogram"]["4"], 1)
+        low.delete()
+        self.assertEqual(self.stats(), {
+            "average": 5.0, "count": 1, "histogram": {"1": 0, "2": 0, "3": 0, "4": 0, "5": 1},
+        })
+
+    def test_rebuild_repairs_drift(self):
+        self.review(3)
+        self.review(4)
+        Product.objects.filter(pk=self.product.pk).update(rating_count=9, rating_sum=1, rating_3=0)
+        self.assertEqual(rebuild_rating_stats(), 1)
+        self.assertEqual(self.stats()["average"], 3.5)
+        self.assertEqual(self.stats()["histogram"]["3"], 1)
+        self.assertEqual(rebuild_rating_stats(), 0)
+
+    def test_cards_read_stats_without_reviews(self):
+        self.review(4)
+        get_cache().clear()
+        with self.assertNumQueries(2):
+            product = self.client.get("/api/products/", {"view": "card"}).json()[0]
+        self.assertEqual(product["rating"], {"average": 4.0, "count": 1})
+
+    def test_review_feed_pages(self):
+        for rating in (1, 2, 3):
+            self.review(rating)
+        response = self.client.get("/api/reviews/", {"product": self.product.pk, "page_size": 2})
+        self.assertEqual([review["rating"] for review in response.json()["results"]], [3, 2])
+        self.assertEqual(len(self.client.get(response.json()["next"]).json()["results"]), 1)
+
+
+class ProductBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        brand = Brand.objects.create(name="Brand")
+        cls.products = [
+            Product.objects.create(name=f"Product {i}", slug=f"product-{i}", description="-", price=100, brand=brand)
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        get_cache().clear()
+
+    def get(self, **params):
+        return self.client.get("/api/products/batch/", {"view": "card", "fields": "id,slug", **params})
+
+    def test_ids_in_requested_order_with_missing(self):
+        first, second, third = (product.pk for product in self.products)
+        data = self.get(ids=f"{third},999999,{first},{third}").json()
+        self.assertEqual([product["id"] for product in data["results"]], [third, first])
+        self.assertEqual(data["missing"], [999999])
+
+    def test_slugs(self):
+        data = self.get(slugs="product-1,nope").json()
+        self.assertEqual(data["results"], [{"id": self.products[1].pk, "slug": "product-1"}])
+        self.assertEqual(data["missing"], ["nope"])
+
+    def test_bad_requests(self):
+        too_many = ",".join(str(i) for i in range(1, BATCH_MAX_PRODUCTS + 2))
+        for params in ({}, {"ids": "1", "slugs": "a"}, {"ids": "1,x"}, {"ids": too_many}):
+            with self.subTest(params=params):
+                self.assertEqual(self.get(**params).status_code, 400)
+
+
+@task(name="store.tests.record", max_attempts=3)
+def record_job(value, fail=False):
+    if fail:
+        raise RuntimeError("boom")
+    JobQueueTests.seen.append(value)
+
+
+class JobQueueTests(TestCase):
+    seen = []
+
+    def setUp(self):
+        JobQueueTests.seen = []
+
+    def test_claim_takes_due_jobs_once(self):
+        due = [enqueue(record_job, value=i) for i in range(3)]
+        later = enqueue(record_job, delay=60, value=99)
+        claimed = claim_jobs(10, worker="w1")
+        self.assertEqual([job.pk for job in claimed], [job.pk for job in due])
+        self.assertTrue(all(job.status == "running" and job.attempts == 1 and job.locked_by == "w1" for job in claimed))
+        self.assertEqual(claim_jobs(10, worker="w2"), [])
+
+        for job in claimed:
+            self.assertTrue(run_job(job))
+        self.assertEqual(self.seen, [0, 1, 2])
+        self.assertEqual(Job.objects.filter(status="succeeded").count(), 3)
+        self.assertEqual(Job.objects.get(pk=later.pk).status, "queued")
+
+    def test_claim_skips_locked_rows(self):
+        if not connection.features.has_select_for_update_skip_locked:
+            self.skipTest("the database has no SELECT ... FOR UPDATE SKIP LOCKED")
+        enqueue(record_job, value=1)
+        with CaptureQueriesContext(connection) as queries:
+            claim_jobs(1)
+        self.assertTrue(any("SKIP LOCKED" in query["sql"] for query in queries.captured_queries))
+
+    def test_failures_back_off_then_fail(self):
+        job = enqueue(record_job, value=1, fail=True)
+        started = now()
+        with self.assertLogs("store.jobs", "WARNING"):
+            self.assertFalse(run_job(claim_jobs(1)[0]))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("queued", 1))
+        self.assertIn("RuntimeError: boom", job.last_error)
+        # BACKOFF_BASE seconds, +/- 20% jitter, doubling per attempt.
+        self.assertTrue(started + timedelta(seconds=7) < job.run_at < started + timedelta(seconds=13), job.run_at)
+        self.assertEqual(claim_jobs(1), [])
+
+        for _ in range(2):
+            Job.objects.filter(pk=job.pk).update(run_at=now())
+            with self.assertLogs("store.jobs", "WARNING"):
+                run_job(claim_jobs(1)[0])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ("failed", 3))
+
+    def test_unknown_task_fails_at_once(self):
+        job = Job.objects.create(name="store.tests.missing")
+        with self.assertLogs("store.jobs", "WARNING"):
+            self.assertFalse(run_job(claim_jobs(1)[0]))
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+        self.assertIn("Unknown task", job.last_error)
+
+    @override_settings(JOB_LOCK_TIMEOUT=60)
+    def test_stale_running_jobs_are_requeued(self):
+        stale = enqueue(record_job, value=1)
+        exhausted = enqueue(record_job, value=2)
+        old = claim_jobs(10, worker="dead")
+        Job.objects.filter(pk=exhausted.pk).update(attempts=3)
+        Job.objects.update(locked_at=now() - timedelta(minutes=5))
+
+        reclaimed = claim_jobs(10, worker="w2")
+        self.assertEqual([(job.pk, job.attempts) for job in reclaimed], [(stale.pk, 2)])
+        self.assertEqual(Job.objects.get(pk=exhausted.pk).status, "failed")
+
+        # The dead worker finishing late doesn't overwrite the new claim.
+        run_job(old[0])
+        self.assertEqual(Job.objects.get(pk=stale.pk).status, "running")
+        run_job(reclaimed[0])
+        self.assertEqual(Job.objects.get(pk=stale.pk).status, "succeeded")
+
+    @override_settings(JOBS_RUN_INLINE=True)
+    def test_inline_jobs_run_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            job = enqueue(record_job, value=7)
+            self.assertEqual(self.seen, [])
+        self.assertEqual(self.seen, [7])
+        self.assertEqual(Job.objects.get(pk=job.pk).status, "succeeded")
@@ -12,7 +12,14 @@ from .views import (
     get_best_sellers,
     get_featured_products,
     get_product_detail,
-    get_reviews
+    export_products,
+    get_products_batch,
+    get_related_products,
+    get_reviews,
+    search_products,
+    search_suggest,
+    search_suggest_stats,
+    counter_stats,
 )
 
 router = DefaultRouter()
@@ -25,10 +32,17 @@ urlpatterns = [
     path('products/trending/', get_trending_products, name="trending-products"),
     path('products/best-sellers/', get_best_sellers, name="best-sellers"),
     path('products/featured/', get_featured_products, name="featured-products"),
+    path('products/batch/', get_products_batch, name="products-batch"),
+    path('products/export/', export_products, name="export-products"),
+    path('products/<slug:slug>/related/', get_related_products, name="related-products"),
     path('products/<slug:slug>/', get_product_detail, name="product-detail"),
     path('categories/', get_categories, name="categories"),
     path('filtered-products/', filtered_products, name="filtered-products"),
     path('reviews/', get_reviews, name="reviews"),
+    path('search/', search_products, name="search"),
+    path('search/suggest/', search_suggest, name="search-suggest"),
+    path('search/suggest/stats/', search_suggest_stats, name="search-suggest-stats"),
+    path('counters/stats/', counter_stats, name="counter-stats"),
 
     # DRF Router URLs
     path('', include(router.urls)),
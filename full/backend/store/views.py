@@ -1,35 +1,72 @@
 from rest_framework import viewsets
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
-from .models import Brand, Product, ProductImage,Category,Review
-from .serializers import BrandSerializer, ProductSerializer, ProductImageSerializer,CategorySerializer,ReviewSerializer
+from rest_framework.permissions import IsAdminUser
+from rest_framework.utils.urls import replace_query_param
+from .models import Brand, Product, ProductImage, Category, Review, ProductType
+from .serializers import (
+    BrandSerializer, ProductSerializer, ProductImageSerializer, CategorySerializer, ReviewSerializer,
+    ProductReviewSerializer,
+    get_product_representation,
+)
+from .prefetch import EagerLoadingMixin, eager_load
+from .cache import catalog_cache
+from .counters import get_counters, incr
+from .idempotency import idempotent
+from .conditional import (
+    conditional, conditional_response, product_list_modified, category_list_modified, product_modified,
+    related_products_modified,
+)
+from .search import MAX_QUERY_LENGTH, get_index
+from .suggest import get_suggest_index
+from .facets import TRUE_VALUES, facet_counts, filter_q, parse_filters
+from .pagination import (
+    ProductCursorPagination, BestSellerCursorPagination, NameCursorPagination, IdCursorPagination,
+    ReviewCursorPagination, paginated_response,
+)
+from .streaming import get_stream_format, streaming_response
 from django.shortcuts import render
 from django.http import JsonResponse
-class BrandViewSet(viewsets.ModelViewSet):
-    queryset = Brand.objects.all()
-    serializer_class = BrandSerializer
 
-from rest_framework import viewsets
-from rest_framework.response import Response
-from rest_framework.decorators import api_view
-from .models import Brand, Product, ProductImage,Category
-from .serializers import BrandSerializer, ProductSerializer, ProductImageSerializer,CategorySerializer
-from .models import Product, Category, ProductType
+
 class BrandViewSet(viewsets.ModelViewSet):
     queryset = Brand.objects.all()
     serializer_class = BrandSerializer
+    pagination_class = NameCursorPagination
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(EagerLoadingMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all().order_by('-created_at')
     serializer_class = ProductSerializer
+    pagination_class = ProductCursorPagination
+    restrict_columns = True
+
+    def get_serializer_class(self):
+        return get_product_representation(self.request)[0]
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', get_product_representation(self.request)[1])
+        return super().get_serializer(*args, **kwargs)
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True, context={'request': request})
-        return Response(serializer.data)
-    
+        return conditional_response(request, product_list_modified(request), self._list, *args, **kwargs)
+
+    def _list(self, request, *args, **kwargs):
+        # ``?stream=true`` (or ``ndjson``) sends the whole list without building it in memory.
+        fmt = get_stream_format(request)
+        if fmt is None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        return streaming_response(queryset, self.get_serializer(), self.paginator.get_ordering(request), fmt)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        response = conditional_response(request, product_modified(request, pk=pk), super().retrieve, *args, **kwargs)
+        if response.status_code == 200:
+            incr('view_count', int(pk))
+        return response
+
     def get_queryset(self):
-        queryset = Product.objects.all().order_by('-created_at')
+        queryset = super().get_queryset().order_by(*self.paginator.get_ordering(self.request))
 
         # Check for `is_featured=true` in query parameters
         is_featured = self.request.query_params.get("is_featured")
@@ -41,74 +78,156 @@ class ProductViewSet(viewsets.ModelViewSet):
 class ProductImageViewSet(viewsets.ModelViewSet):
     queryset = ProductImage.objects.all()
     serializer_class = ProductImageSerializer
+    pagination_class = IdCursorPagination
 
 @api_view(['GET'])
-def get_trending_products(request):
-    """Get trending products"""
-    trending_products = Product.objects.filter(is_trending=True)
-    serializer = ProductSerializer(trending_products, many=True, context={'request': request})
-    return Response(serializer.data)
-@api_view(['GET'])
-def get_best_sellers(request):
-    """Get top 10 best selling products"""
-    best_sellers = Product.objects.filter(sales_count__gt=0).order_by('-sales_count')[:10]
-    serializer = ProductSerializer(best_sellers, many=True, context={'request': request})
-    return Response(serializer.data)
-@api_view(['GET'])
-def get_featured_products(request):
-    """Get featured products"""
-    featured_products = Product.objects.filter(is_featured=True)
-    serializer = ProductSerializer(featured_products, many=True, context={'request': request})
-    return Response(serializer.data)
-
-class ProductImageViewSet(viewsets.ModelViewSet):
-    queryset = ProductImage.objects.all()
-    serializer_class = ProductImageSerializer
-
-@api_view(['GET'])
+@conditional(product_list_modified)
+@catalog_cache()
 def get_trending_products(request):
     trending_products = Product.objects.filter(is_trending=True)
     
     if not trending_products.exists():
         return Response({"message": "No trending products found"}, status=404)
-    
-    serializer = ProductSerializer(trending_products, many=True, context={"request": request})
-    return Response(serializer.data)
+
+    serializer_class, fields = get_product_representation(request)
+    return paginated_response(request, trending_products, serializer_class, fields=fields)
 @api_view(['GET'])
+@conditional(product_list_modified)
+@catalog_cache()
 def get_best_sellers(request):
-    best_sellers = Product.objects.filter(sales_count__gt=10).order_by('-sales_count')[:10]  # ✅ Show top-selling products
-    serializer = ProductSerializer(best_sellers, many=True, context={"request": request})
-    return Response(serializer.data)
+    best_sellers = Product.objects.filter(sales_count__gt=10).order_by('-sales_count')  # ✅ Show top-selling products
+    serializer_class, fields = get_product_representation(request)
+    return paginated_response(request, best_sellers, serializer_class, BestSellerCursorPagination,
+                              fields=fields, limit=10)
 
 @api_view(['GET'])
+@conditional(product_list_modified)
+@catalog_cache()
 def get_featured_products(request):
     """Fetch only products that are marked as featured."""
     featured_products = Product.objects.filter(is_featured=True)
-    serializer = ProductSerializer(featured_products, many=True, context={'request': request})
-    return Response(serializer.data)
+    serializer_class, fields = get_product_representation(request)
+    return paginated_response(request, featured_products, serializer_class, fields=fields)
 
 @api_view(["GET"])
+@conditional(product_modified)
 def get_product_detail(request, slug):
     try:
-        product = Product.objects.get(slug=slug)
-        serializer = ProductSerializer(product, context={"request": request})
+        serializer_class, fields = get_product_representation(request)
+        serializer = serializer_class(context={"request": request}, fields=fields)
+        product = eager_load(Product.objects.all(), serializer, only=True).get(slug=slug)
+        serializer = serializer_class(product, context={"request": request}, fields=fields)
+        incr('view_count', product.pk)
         return Response(serializer.data)
     except Product.DoesNotExist:
         return Response({"error": "Product not found"}, status=404)
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export_products(request):
+    """
+    Stream the whole catalog (optionally narrowed by the filtered-products
+    filters) as a JSON array, or as NDJSON with ``stream=ndjson``.
+    """
+    try:
+        filters = parse_filters(request.query_params)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+
+    fmt = get_stream_format(request) or 'json'
+    serializer_class, fields = get_product_representation(request)
+    serializer = serializer_class(context={"request": request}, fields=fields)
+    products = eager_load(Product.objects.filter(filter_q(filters)), serializer, only=True)
+    ordering = ProductCursorPagination().get_ordering(request)
+    return streaming_response(products, serializer, ordering, fmt, filename="products")
+
+
+BATCH_MAX_PRODUCTS = 100
+
+
+@api_view(['GET'])
+@conditional(product_list_modified)
+@catalog_cache()
+def get_products_batch(request):
+    """
+    Up to ``BATCH_MAX_PRODUCTS`` products by ``ids=1,2,3`` or ``slugs=a,b``,
+    in the requested order, with the ones that don't exist under ``missing``.
+    """
+    ids = request.query_params.get('ids')
+    slugs = request.query_params.get('slugs')
+    if bool(ids) == bool(slugs):
+        return Response({"error": "Pass either ids or slugs"}, status=400)
+
+    keys = list(dict.fromkeys(value.strip() for value in (ids or slugs).split(',') if value.strip()))
+    if len(keys) > BATCH_MAX_PRODUCTS:
+        return Response({"error": f"At most {BATCH_MAX_PRODUCTS} products per request"}, status=400)
+    if ids:
+        if not all(key.isdigit() for key in keys):
+            return Response({"error": "ids must be integers"}, status=400)
+        keys = [int(key) for key in keys]
+    field = 'id' if ids else 'slug'
+
+    serializer_class, fields = get_product_representation(request)
+    serializer = serializer_class(context={"request": request}, fields=fields)
+    found = eager_load(Product.objects.all(), serializer, only=True).in_bulk(keys, field_name=field)
+    products = [found[key] for key in keys if key in found]
+    return Response({
+        "results": serializer_class(products, many=True, context={"request": request}, fields=fields).data,
+        "missing": [key for key in keys if key not in found],
+    })
+
+
+@api_view(['GET'])
+@conditional(related_products_modified)
+@catalog_cache()
+def get_related_products(request, slug):
+    """
+    "Customers also bought" for a product, from the precomputed neighbours
+    (``manage.py build_related_products``), topped up with the newest
+    products from the same category, then the same brand.
+    """
+    try:
+        limit = min(max(int(request.query_params.get('limit', 12)), 1), 50)
+    except ValueError:
+        return Response({"error": "limit must be an integer"}, status=400)
+
+    serializer_class, fields = get_product_representation(request, default='card')
+    serializer = serializer_class(context={"request": request}, fields=fields)
+    products = eager_load(Product.objects.all(), serializer, only=True)
+    related = list(products.filter(neighbour_of__product__slug=slug).order_by('neighbour_of__rank')[:limit])
+
+    if len(related) < limit:
+        product = Product.objects.filter(slug=slug).only('id', 'category_id', 'brand_id').first()
+        if product is None:
+            return Response({"error": "Product not found"}, status=404)
+        seen = [product.pk] + [item.pk for item in related]
+        for lookup in ({'category_id': product.category_id}, {'brand_id': product.brand_id}):
+            if len(related) >= limit or None in lookup.values():
+                continue
+            fallback = products.filter(**lookup).exclude(pk__in=seen).order_by('-created_at', '-id')
+            fallback = list(fallback[:limit - len(related)])
+            related += fallback
+            seen += [item.pk for item in fallback]
+
+    return Response(serializer_class(related, many=True, context={"request": request}, fields=fields).data)
+
+
 # views.py
 @api_view(['GET', 'POST'])
+@idempotent()
 def get_reviews(request):
     if request.method == 'GET':
         product_id = request.query_params.get('product')
-        queryset = Review.objects.all().order_by('-created_at')
+        queryset = Review.objects.all()
         if product_id:
+            if not product_id.isdigit():
+                return Response({"error": "product must be an id"}, status=400)
             queryset = queryset.filter(product=product_id)
-        serializer = ReviewSerializer(queryset[:10], many=True)
-        return Response(serializer.data)
+        # The 10 newest as a plain list, or cursor pages with ?page_size / ?cursor.
+        return paginated_response(request, queryset, ReviewSerializer, ReviewCursorPagination, limit=10)
     elif request.method == 'POST':
-        serializer = ReviewSerializer(data=request.data)
+        serializer = ProductReviewSerializer(data=request.data)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=201)
@@ -116,31 +235,93 @@ def get_reviews(request):
 
 # store/views.py
 @api_view(['GET'])
+@conditional(product_list_modified)
+@catalog_cache()
 def filtered_products(request):
-    category_slug = request.GET.get('category')
-    product_type_slug = request.GET.get('product_type')
-
-    # Build filter parameters
-    filters = {}
-    if category_slug:
-        filters['category__slug'] = category_slug
-    if product_type_slug:
-        filters['product_type__slug'] = product_type_slug
+    """
+    Products filtered by category, product_type, brand, color, fabric_type,
+    work_type, occasion, price_min/price_max, discount and in_stock. Pass
+    ``facets=true`` to also get per-value counts for every dimension.
+    """
+    try:
+        filters = parse_filters(request.query_params)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
 
     try:
-        products = Product.objects.filter(**filters)\
-            .select_related('category', 'product_type', 'brand')\
-            .prefetch_related('images')
-            
-        serializer = ProductSerializer(products, many=True, context={'request': request})
-        return Response(serializer.data)
+        products = Product.objects.filter(filter_q(filters))
+        serializer_class, fields = get_product_representation(request)
+        response = paginated_response(request, products, serializer_class, fields=fields)
+        if request.query_params.get('facets', '').lower() in TRUE_VALUES:
+            data = response.data if isinstance(response.data, dict) else {"results": response.data}
+            data["facets"] = facet_counts(Product.objects.all(), filters)
+            response = Response(data)
+        return response
 
     except Exception as e:
         return Response({"error": str(e)}, status=400)
 
 
 @api_view(['GET'])
+@conditional(category_list_modified)
+@catalog_cache()
 def get_categories(request):
     categories = Category.objects.all()
-    serializer = CategorySerializer(categories, many=True, context={'request': request})
-    return Response(serializer.data)
+    return paginated_response(request, categories, CategorySerializer, NameCursorPagination)
+
+
+@api_view(['GET'])
+def search_products(request):
+    """Full-text product search ranked by BM25, with optional category/product_type filters."""
+    query = request.query_params.get('q', '').strip()[:MAX_QUERY_LENGTH]
+    try:
+        page = max(int(request.query_params.get('page', 1)), 1)
+        page_size = min(max(int(request.query_params.get('page_size', 20)), 1), 100)
+    except ValueError:
+        return Response({"error": "page and page_size must be integers"}, status=400)
+
+    index = get_index()
+    index.ensure_built()
+    ids = index.search(
+        query,
+        category=request.query_params.get('category'),
+        product_type=request.query_params.get('product_type'),
+        limit=page_size + 1,
+        offset=(page - 1) * page_size,
+    )
+    has_next = len(ids) > page_size
+    ids = ids[:page_size]
+
+    serializer_class, fields = get_product_representation(request, default='card')
+    serializer = serializer_class(context={'request': request}, fields=fields)
+    products = eager_load(Product.objects.filter(id__in=ids), serializer, only=True).in_bulk()
+    ranked = [products[pk] for pk in ids if pk in products]
+
+    next_url = None
+    if has_next:
+        next_url = replace_query_param(request.build_absolute_uri(), 'page', page + 1)
+    return Response({
+        "query": query,
+        "next": next_url,
+        "results": serializer_class(ranked, many=True, context={'request': request}, fields=fields).data,
+    })
+
+
+@api_view(['GET'])
+def search_suggest(request):
+    """Typeahead: the top product names, brands and categories starting with ``q``."""
+    query = request.query_params.get('q', '')
+    return Response({"query": query, **get_suggest_index().suggest(query)})
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def search_suggest_stats(request):
+    return Response(get_suggest_index().stats())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def counter_stats(request):
+    """Flush lag and totals of this worker's buffered product counters."""
+    return Response(get_counters().stats())